@@ -3,20 +3,25 @@
 ======================================
 
 Questa applicazione Streamlit permette di raccogliere feedback da piloti su NOTAM sintetici.
-Ogni utente accede con username e password, lavora su una copia personale del dataset e i feedback vengono salvati
-in file CSV sul PC locale.
+Ogni utente accede con username e password, lavora sul dataset condiviso (sola lettura) tenendo in sessione
+solo i propri feedback, che vengono salvati in file CSV sul PC locale.
 
 👨‍💻 Flusso generale:
 1. L'utente inserisce una password di accesso (presa dai secrets di Streamlit).
-2. Viene scaricato il database congelato dei NOTAM da Google Drive (solo lettura).
+2. Viene scaricato il database congelato dei NOTAM da Google Drive (solo lettura) in una cache
+   versionata e verificata (`db_cache/`), ricontrollata periodicamente per nuove versioni.
 3. L'utente inserisce il proprio username → Si crea un file dedicato (feedback_<username>.csv).
+   Se nei secrets c'è `PILOTS`, ogni pilota vede solo i NOTAM che gli sono assegnati
+   (vedi `workload_scheduler`).
 4. Per ogni NOTAM vengono mostrati:
    - Contesto (Purpose, Topic)
    - Testo del NOTAM
    - Categoria con info di rilevanza
    - Classi di impatto
 5. L'utente fornisce feedback.
-6. Il feedback viene salvato solo localmente in un file CSV.
+6. Il feedback viene salvato solo localmente: ogni salvataggio aggiunge un record al journal
+   dell'utente (`feedback_<username>.journal`), scritto in background (`write_behind`) e
+   compattato nel CSV all'uscita.
 7. L'utente può:
    - Navigare avanti/indietro
    - Salvare feedback
@@ -24,19 +29,32 @@ in file CSV sul PC locale.
 
 📂 Output:
 - Ogni utente produce un file CSV: `feedback_<username>.csv`
-  che viene aggiornato man mano che compila i feedback.
+  che viene aggiornato all'uscita ("Exit for today") a partire dal journal dei salvataggi.
 """
 
 import streamlit as st
 st.set_page_config(page_title="Synthetic NOTAM Reinforcing Pipeline", layout="wide")
 
-import pandas as pd
+import io
 import os
-import re
-import gdown
-from notam_tags_rel_levels import notam_general_relevance  # importa il dizionario
+import time
+from notam_tags_rel_levels import notam_general_relevance, impact_levels  # importa il dizionario
+from notam_loader import load_dataset
+from notam_render import get_cards, prefetch
+from progress_index import ProgressIndex, queue_names
+from workload_scheduler import WorkloadScheduler, DoneWriter
+from batch_annotation import BATCH_PAGE_SIZE, INFO_COLS, filter_positions, page_frame, changed_feedback
+from dataset_cache import ensure_dataset
+from write_behind import get_saver
+from search_index import SearchIndex, NotesWriter
+from feedback_store import open_store, read_overlay
+from instrumentation import start_rerun, phase_percentiles
+
+# --- timing delle fasi del rerun (attivo solo se PROFILE_LOG è nei secrets) ---
+timer = start_rerun(st.session_state, st.secrets.get("PROFILE_LOG"))
 
 # --- PASSWORD CHECK ---
+timer.phase("auth")
 password = st.text_input("🔑 Enter access password:", type="password")
 if not password:  # se il campo è vuoto
     st.stop()
@@ -45,16 +63,23 @@ if password != st.secrets["APP_PASSWORD"]:
     st.stop()
 
 # --- CARICAMENTO DB CENTRALE ---
-CSV_PATH = "db.csv"
-url = st.secrets["DB_URL"]  # link diretto al file db.csv su Google Drive
+timer.phase("dataset_load")
+url = st.secrets["DB_URL"]  # link diretto al file db.csv su Google Drive (o file:// locale)
 
-if not os.path.exists(CSV_PATH):
-    with st.spinner("Downloading NOTAM database (first run)..."):
-        gdown.download(url, CSV_PATH, quiet=False)
+# download verificato e atomico in una cache versionata; la sorgente viene ricontrollata
+# al più ogni DB_REFRESH_SECONDS e ogni versione è convertita una volta in formato Arrow
+with st.spinner("Checking NOTAM database..."):
+    DB_PATH = ensure_dataset(url,
+                             cache_dir=st.secrets.get("DB_CACHE_DIR", "db_cache"),
+                             expected_sha256=st.secrets.get("DB_SHA256"),
+                             refresh_seconds=st.secrets.get("DB_REFRESH_SECONDS", 3600))
 
-df = pd.read_csv(CSV_PATH)
+# apertura una sola volta per versione del file, condivisa tra tutte le sessioni
+dataset = load_dataset(DB_PATH)
+df = dataset.df
 
 # --- app title ---
+timer.phase("user_load")
 st.title("🛫 Synthetic NOTAM Reinforcing Pipeline")
 
 # --- user login ---
@@ -62,8 +87,35 @@ username = st.text_input("Enter your username (use lowercase, no spaces):").stri
 if not username:
     st.warning("Please enter your username to continue.")
     st.stop()
-
-USER_CSV = f"feedback_{username}.csv"
+timer.user = username
+is_admin = username in st.secrets.get("ADMIN_USERS", [])
+
+# --- valori non validi nel DB, raccolti al caricamento (solo admin) ---
+if is_admin and not dataset.issues.empty:
+    with st.expander(f"⚠️ {len(dataset.issues)} invalid values in "
+                     f"{dataset.issues['notam_key'].nunique()} NOTAMs of the database"):
+        st.dataframe(dataset.issues)
+
+# backend dei feedback: "journal" (default) oppure "sqlite"; una connessione per sessione
+FEEDBACK_BACKEND = st.secrets.get("FEEDBACK_BACKEND", "journal")
+# indice di ricerca full-text (NOTAM + note dei piloti), una connessione per sessione
+SEARCH_DB = st.secrets.get("SEARCH_DB", "search.sqlite")
+if "search_index" not in st.session_state:
+    st.session_state.search_index = SearchIndex(SEARCH_DB)
+search_index = st.session_state.search_index
+
+if "store" not in st.session_state or st.session_state.store.username != username:
+    st.session_state.store = open_store(FEEDBACK_BACKEND, username,
+                                        db_path=st.secrets.get("FEEDBACK_DB", "feedback.sqlite"))
+    # connessione separata: la usa solo il thread del writer in background
+    st.session_state.notes_writer = NotesWriter(SEARCH_DB, username)
+store = st.session_state.store
+notes_writer = st.session_state.notes_writer
+USER_CSV = store.csv_path
+
+# i salvataggi vengono scritti da un thread in background ogni WRITE_BEHIND_SECONDS
+# (0 = scrittura immediata sul thread dello script)
+saver = get_saver(st.secrets.get("WRITE_BEHIND_SECONDS", 2))
 
 # --- reminder ---
 st.info("💡 Reminder: If you already started annotating before, **upload your previous feedback CSV** "
@@ -73,184 +125,318 @@ st.info("💡 Reminder: If you already started annotating before, **upload your
 st.markdown("### 📂 Load your previous feedback file (optional)")
 uploaded_file = st.file_uploader("Upload your feedback CSV to resume progress:", type=["csv"])
 
-if uploaded_file is not None:
-    # l'utente carica il file scaricato in precedenza
-    df_user = pd.read_csv(uploaded_file)
-    st.success("✅ Feedback file loaded. You can resume where you left off.")
-else:
-    # se non carica nulla, usa quello sul server (se esiste)
+# il dataset resta condiviso e immutabile: la sessione tiene solo un overlay sparso
+# {notam_key: campi fb_*} con le righe annotate, caricato una volta per sessione
+if st.session_state.get("overlay_user") != username:
+    overlay = {}
     if os.path.exists(USER_CSV):
-        df_user = pd.read_csv(USER_CSV)
-    else:
-        df_user = df.copy()
-
-# assicurati che tutte le colonne di feedback esistano
-for col in ["fb_style", "fb_category", "fb_corrected_category",
-            "fb_realism", "fb_impact_med", "fb_impact_tech",
-            "fb_impact_land", "fb_notes", "last_index"]:
-    if col not in df_user.columns:
-        df_user[col] = ""
+        overlay, _ = read_overlay(USER_CSV)
+    # salvataggi non ancora compattati nel CSV (journal) o già nel database (sqlite);
+    # prima si scrivono quelli dell'utente ancora nel buffer (es. una sessione precedente
+    # appena chiusa), senza aspettare gli altri utenti
+    if not saver.flush(st.secrets.get("LOGIN_FLUSH_SECONDS", 10), username=username):
+        st.warning("⚠️ Some of your recent feedback is still being written to disk and may "
+                   "not be shown yet.")
+    overlay.update(store.replay())
+    saver.submit(notes_writer, overlay)  # note già scritte → indice di ricerca, in background
+    st.session_state.overlay = overlay
+    st.session_state.overlay_user = username
+overlay = st.session_state.overlay
 
 # --- track progress ---
 if "index" not in st.session_state:
     st.session_state.index = 0
-if "resume_loaded" not in st.session_state:
-    st.session_state.resume_loaded = False
 
-# se l'utente carica un file e non hai già caricato in questa sessione
-if uploaded_file is not None and not st.session_state.resume_loaded:
-    last_idx_vals = df_user["last_index"].dropna()
-    if not last_idx_vals.empty:
+# --- assegnazione dei NOTAM (solo se PILOTS è nei secrets) ---
+# ogni pilota registrato vede solo la propria coda; senza PILOTS tutti vedono tutto il dataset
+PILOTS = st.secrets.get("PILOTS", [])
+scheduler = None
+if PILOTS:
+    if "scheduler" not in st.session_state or st.session_state.scheduler.version != dataset.version:
+        st.session_state.scheduler = WorkloadScheduler(
+            st.secrets.get("ASSIGNMENT_DB", "assignments.sqlite"), dataset, PILOTS,
+            redundancy=st.secrets.get("ASSIGNMENT_REDUNDANCY", 3),
+            drop_after_days=st.secrets.get("ASSIGNMENT_DROP_DAYS", 7))
+        st.session_state.scheduler.ensure_plan()
+    scheduler = st.session_state.scheduler
+    if st.session_state.get("done_writer_for") != (dataset.version, username):
+        # flag `done` scritti dal writer in background, con una connessione sua
+        st.session_state.done_writer = DoneWriter(scheduler, username)
+        st.session_state.done_writer_for = (dataset.version, username)
+    done_writer = st.session_state.done_writer
+    if username not in PILOTS and not is_admin:
+        st.error("❌ This username is not registered for annotation. Contact the administrator.")
+        st.stop()
+    if is_admin:
+        with st.expander("🗓️ Assignments per pilot"):
+            st.dataframe(scheduler.stats())
+            if st.button("🔄 Rebalance now"):
+                st.info(f"{scheduler.rebalance()} assignments moved.")
+
+# bitmap delle righe annotate + contatori per categoria, accanto all'overlay
+# (ricostruita solo se cambia utente, versione del dataset o coda assegnata: la coda
+# può cambiare anche per un ribilanciamento chiesto da un'altra sessione)
+queue_revision = None
+if scheduler is not None and username in PILOTS:
+    queue_revision = scheduler.queue_revision(username)
+if st.session_state.get("progress_for") != (username, dataset.version, queue_revision):
+    view = None
+    if scheduler is not None and username in PILOTS:
+        scheduler.checkin(username)
+        scheduler.mark_done(username, overlay.keys())
+        scheduler.rebalance()
+        queue_revision = scheduler.queue_revision(username)
+        assigned = dataset.key_index.get_indexer(scheduler.queue(username))
+        view = assigned[assigned >= 0]
+    previous = st.session_state.get("progress_index")
+    progress_index = st.session_state.progress_index = ProgressIndex(dataset, overlay.keys(), view=view)
+    st.session_state.progress_for = (username, dataset.version, queue_revision)
+    if previous is not None and st.session_state.index < len(previous):
+        # nuova versione del dataset o coda cambiata: l'indice segue la notam_key della
+        # riga corrente; se non c'è più si riparte dal primo non annotato
+        key = previous.dataset.df["notam_key"].iat[previous.position(st.session_state.index)]
+        current = progress_index.index_of(dataset.position(key))
+        st.session_state.index = current if current is not None else progress_index.next_unannotated(0) or 0
+    elif view is not None:
+        st.session_state.index = progress_index.next_unannotated(0) or 0
+progress_index = st.session_state.progress_index
+n_rows = len(progress_index)
+
+# se l'utente carica un file non ancora letto in questa sessione
+if uploaded_file is not None and st.session_state.get("resume_loaded") != uploaded_file.file_id:
+    uploaded_overlay, saved_progress = read_overlay(uploaded_file)
+    overlay.update(uploaded_overlay)
+    # scritto dal writer in background, come i salvataggi (la connessione dello store è sua)
+    saver.submit(store, uploaded_overlay)
+    saver.submit(notes_writer, uploaded_overlay)
+    if scheduler is not None:
+        saver.submit(done_writer, uploaded_overlay)
+    progress_index.mark_keys(uploaded_overlay.keys())
+
+    # indice nella coda dell'utente (l'intero dataset se non c'è lo scheduler)
+    st.session_state.index = 0
+    if "last_key" in saved_progress:
+        last_idx = progress_index.index_of(dataset.position(saved_progress["last_key"]))
+        st.session_state.index = last_idx if last_idx is not None else 0
+    elif "last_index" in saved_progress:
+        # file salvati prima delle chiavi stabili
         try:
-            st.session_state.index = int(last_idx_vals.astype(int).iloc[-1])
+            last_idx = progress_index.index_of(min(int(saved_progress["last_index"]), len(df) - 1))
+            st.session_state.index = last_idx if last_idx is not None else 0
         except Exception:
             st.session_state.index = 0
-    else:
-        st.session_state.index = 0
-    st.session_state.resume_loaded = True
+    st.session_state.resume_loaded = uploaded_file.file_id
+
+if uploaded_file is not None:
+    st.success("✅ Feedback file loaded. You can resume where you left off.")
+
+
+def exit_for_today(last_key):
+    """Export completo: compatta nel CSV lato server e offre il download all'utente."""
+    # il frame completo viene costruito solo qui, per l'export
+    with timer.span("export"):
+        # tutti i salvataggi nello store prima dell'export; se la scrittura fallisce non si
+        # compatta (il journal / database restano com'erano e i feedback restano nel buffer)
+        if not saver.flush(st.secrets.get("EXIT_FLUSH_SECONDS", 60), store=store):
+            st.error(f"⚠️ Your feedback could not be written to disk: {saver.status(store)['error'] or 'timeout'}. "
+                     "Nothing was lost: please try again in a moment.")
+            st.stop()
+        # il CSV unisce export precedente, journal (anche di altre schede) e sessione
+        df_out = store.compact(df, overlay, last_key)
+
+    # prepara CSV per download locale dell’utente
+    csv_buffer = io.StringIO()
+    df_out.to_csv(csv_buffer, index=False)
+
+    st.success("✅ Feedback saved. Download the file to keep it with you 👇")
+
+    st.download_button(
+        label="⬇️ Download your feedback",
+        data=csv_buffer.getvalue(),
+        file_name=USER_CSV,
+        mime="text/csv"
+    )
 
-current_idx = st.session_state.index
-if current_idx >= len(df_user):
-    st.success(f"✅ {username}, you have completed all NOTAMs. Thank you! 🎉")
     st.stop()
 
-row = df_user.iloc[current_idx]
 
-# --- progress bar ---
-progress = (current_idx+1)/len(df_user)
-st.progress(progress)
-st.caption(f"NOTAM {current_idx+1} of {len(df_user)} for user: {username}")
+def show_flush_status():
+    # --- stato della scrittura in background dei feedback ---
+    status = saver.status(store)
+    if status["error"]:
+        st.error(f"⚠️ Saving to disk failed, retrying: {status['error']}")
+    elif status["pending"]:
+        st.caption(f"⏳ {status['pending']} feedback waiting to be written to disk")
+    elif status["last_flush"]:
+        st.caption(f"💾 All feedback written to disk ({time.strftime('%H:%M:%S', time.localtime(status['last_flush']))})")
+
+
+def show_admin_timings():
+    # --- pannello tempi (solo admin) ---
+    if timer.enabled and is_admin:
+        with st.expander("⏱️ Rerun timings (p50 / p95 per phase, recent reruns)"):
+            st.dataframe(phase_percentiles())
+
+
+# --- modalità: un NOTAM per schermata oppure pagina modificabile (batch) ---
+mode = st.radio("Annotation mode:", ["One NOTAM at a time", "Batch (table)"], horizontal=True)
+
+if mode == "Batch (table)":
+    timer.phase("row_extract")
+    st.markdown("### 📑 Batch annotation")
+    fcol1, fcol2 = st.columns(2)
+    filter_categories = fcol1.multiselect("Category (tag_type):", list(notam_general_relevance.keys()))
+    filter_relevances = fcol2.multiselect("Relevance:", impact_levels)
+    positions = filter_positions(df, filter_categories, filter_relevances)
+    positions = positions[progress_index.view_of[positions] >= 0]  # solo la coda dell'utente
+
+    n_pages = max((len(positions) + BATCH_PAGE_SIZE - 1) // BATCH_PAGE_SIZE, 1)
+    page_number = st.number_input(f"Page (of {n_pages}):", min_value=1, max_value=n_pages, value=1)
+    page_positions = positions[(page_number - 1) * BATCH_PAGE_SIZE:page_number * BATCH_PAGE_SIZE]
+    st.caption(f"{len(positions)} NOTAMs match the filters, "
+               f"showing {len(page_positions)} on page {page_number} of {n_pages} for user: {username}")
+    page = page_frame(df, overlay, page_positions)
+
+    timer.phase("render")
+    # dentro un form le modifiche alla griglia non fanno rerun: un solo invio per pagina
+    with st.form(f"batch_{page_number}_{'|'.join(filter_categories)}_{'|'.join(filter_relevances)}"):
+        edited = st.data_editor(
+            page,
+            hide_index=True,
+            disabled=INFO_COLS,
+            column_config={
+                "notam_key": None,  # nascosta, serve solo come chiave
+                "notam_text": st.column_config.TextColumn("NOTAM", width="large"),
+                "fb_style": st.column_config.SelectboxColumn("ICAO style (1=✗, 2=✓)", options=[1, 2]),
+                "fb_category": st.column_config.SelectboxColumn("Category ok (0/1)", options=[0, 1]),
+                "fb_corrected_category": st.column_config.SelectboxColumn(
+                    "Correct category", options=list(notam_general_relevance.keys())),
+                "fb_realism": st.column_config.SelectboxColumn("Realism (1=low, 2=high)", options=[1, 2]),
+                "fb_impact_med": st.column_config.SelectboxColumn("🩺 Medical", options=impact_levels),
+                "fb_impact_tech": st.column_config.SelectboxColumn("⚙️ Technical", options=impact_levels),
+                "fb_impact_land": st.column_config.SelectboxColumn("🛬 Land ASAP", options=impact_levels),
+                "fb_notes": st.column_config.TextColumn("📝 Notes"),
+            },
+        )
+        submitted = st.form_submit_button("💾 Save page")
+
+    if submitted:
+        page_feedback = changed_feedback(page, edited)
+        if page_feedback:
+            overlay.update(page_feedback)
+            progress_index.mark_keys(page_feedback.keys())
+            # una sola scrittura per tutta la pagina, in background
+            with timer.span("save"):
+                try:
+                    saver.submit(store, page_feedback)
+                    saver.submit(notes_writer, page_feedback)
+                    if scheduler is not None:
+                        saver.submit(done_writer, page_feedback)
+                except TimeoutError as exc:
+                    st.error(f"⚠️ Saving is stuck, please try again: {exc}")
+                    st.stop()
+        st.success(f"✅ {len(page_feedback)} NOTAMs saved on this page.")
+    show_flush_status()
+
+    if st.button("🚪 Exit for today", key="batch_exit"):
+        exit_for_today(page["notam_key"].iloc[0] if len(page) else df["notam_key"].iloc[0])
+
+    timer.finish()
+    show_admin_timings()
+    st.stop()
 
-# --- extract context and notam text ---
-full_text = row["e_line"]
+timer.phase("row_extract")
+current_idx = st.session_state.index
+if current_idx >= n_rows:
+    if progress_index.total_done == n_rows:
+        st.success(f"✅ {username}, you have completed all NOTAMs. Thank you! 🎉")
+        # lo scheduler può assegnare altro lavoro aperto (da piloti assenti o più carichi)
+        if scheduler is not None and username in PILOTS and st.button("➕ Get more NOTAMs"):
+            saver.flush(10, store=done_writer)  # i flag `done` degli ultimi salvataggi
+            moved = scheduler.rebalance()
+            # indice oltre la fine: la vista nuova riparte dal primo non annotato
+            st.session_state.progress_for = None
+            if moved:
+                st.rerun()
+            st.info("No open NOTAMs to take over right now.")
+        st.stop()
+    # fine della lista ma con NOTAM ancora da annotare
+    st.warning(f"You reached the end of the list: {n_rows - progress_index.total_done} NOTAMs "
+               "are still unannotated.")
+    if st.button("⏭️ Go to the first unannotated NOTAM"):
+        st.session_state.index = progress_index.next_unannotated(0)
+        st.rerun()
+    st.stop()
 
-purpose_match = re.search(r"<Purpose>(.*?)</Purpose>", full_text)
-topic_match = re.search(r"<Topic>(.*?)</Topic>", full_text)
+row_pos = progress_index.position(current_idx)
+row = df.iloc[row_pos]
+row_key = row["notam_key"]
 
-purpose_text = purpose_match.group(1).strip() if purpose_match else ""
-topic_text = topic_match.group(1).strip() if topic_match else ""
+# lettura puntuale dei feedback della riga corrente (lo store vede anche le altre schede)
+row_fb = saver.get(store, row_key) or overlay.get(row_key) or {}
 
-notam_match = re.split(r"</Topic>", full_text, maxsplit=1)
-notam_text = notam_match[1].strip() if len(notam_match) > 1 else full_text.strip()
+# --- progress bar ---
+timer.phase("render")
+# riempiti a fine script, così includono un eventuale salvataggio di questo rerun
+progress_bar = st.empty()
+st.caption(f"NOTAM {current_idx+1} of {n_rows} for user: {username}")
+progress_caption = st.empty()
+
+# --- coda di lavoro: filtri per "Next unannotated" e rimanenti per categoria ---
+with st.expander("🎯 Work queue"):
+    qcol1, qcol2 = st.columns(2)
+    queue_categories = qcol1.multiselect("Only categories:", list(notam_general_relevance.keys()),
+                                         key="queue_categories")
+    queue_relevances = qcol2.multiselect("Only relevance:", impact_levels, key="queue_relevances")
+    remaining_table = st.empty()
+
+# --- ricerca full-text: salta a un NOTAM che contiene i termini cercati ---
+with st.expander("🔎 Search"):
+    search_text = st.text_input("Search NOTAMs (e.g. ILS RWY 27, LIRF):", key="search_text").strip()
+    search_in_notes = st.checkbox("Search in notes instead of NOTAM text"
+                                  + (" (all pilots)" if is_admin else " (your notes)"), key="search_in_notes")
+    if search_text:
+        # la prima ricerca su una nuova versione del dataset costruisce l'indice
+        with st.spinner("Indexing the NOTAM database..."):
+            search_index.ensure_dataset(dataset)
+        if search_in_notes:
+            results = search_index.search_notes(search_text, username=None if is_admin else username)
+        else:
+            results = search_index.search_notams(search_text)
+        # solo i NOTAM presenti nella coda dell'utente, con la loro posizione
+        results["notam"] = [progress_index.index_of(dataset.position(key)) for key in results["notam_key"]]
+        results = results.dropna(subset=["notam"]).astype({"notam": int})
+        results["notam"] += 1
+        st.caption(f"{len(results)} matching NOTAMs")
+        if not results.empty:
+            st.dataframe(results.drop(columns=["notam_key"]), hide_index=True)
+            go_to = st.selectbox("Go to NOTAM:", results["notam"].tolist(), key="search_go_to")
+            if st.button("➡️ Go to NOTAM"):
+                st.session_state.index = go_to - 1
+                st.rerun()
+
+# --- frammenti HTML della scheda (cache condivisa, righe vicine preparate in background) ---
+cards = get_cards(dataset, row_pos)
+prefetch(dataset, current_idx, view=progress_index.view)
 
 # --- LAYOUT ---
 col1, col2 = st.columns([2, 1])
 
 with col1:
     st.markdown("#### 🗂️ Context")
-    st.markdown(
-        f"""
-        <div style="background-color: #eef5ff; padding: 12px; border-radius: 8px;
-                    border: 1px solid #cce; font-size: 16px; font-weight: 500;
-                    line-height: 1.5; color: #000;">
-            <b>Purpose:</b> {purpose_text}<br>
-            <b>Topic:</b> {topic_text}
-        </div>
-        """, unsafe_allow_html=True
-    )
+    st.markdown(cards["context"], unsafe_allow_html=True)
 
     st.markdown("#### 📄 NOTAM Text")
-    st.markdown(
-        f"""
-        <div style="background-color: #f9f9f9; padding: 18px 14px 22px 14px;
-                    border-radius: 10px; border: 1px solid #ddd;
-                    font-family: monospace; font-size: 18px;
-                    line-height: 1.7; white-space: pre-wrap; word-wrap: break-word;
-                    color: #000;">
-            {notam_text}
-        </div>
-        """, unsafe_allow_html=True
-    )
+    st.markdown(cards["notam"], unsafe_allow_html=True)
 
     # --- CATEGORY INFO BOX ---
-    category = row['tag_type']
     st.markdown("#### 🏷️ Category Information")
 
-    custom_colors = {
-        "yellow": "#f1c40f", "red": "#e74c3c",
-        "green": "#2ecc71", "blue": "#3498db", "orange": "#e67e22"
-    }
-
-    if category in notam_general_relevance:
-        cat_info = notam_general_relevance[category]
-        base_color = cat_info["color"].lower()
-        color = custom_colors.get(base_color, "#7f8c8d")
-        relevance = cat_info["relevance"]
-        desc = cat_info["description"]
-
-        badge_colors = {
-            "Low": "#2ecc71", "Medium": "#f1c40f",
-            "High": "#e67e22", "Critical": "#e74c3c"
-        }
-        badge_color = badge_colors.get(relevance, "#95a5a6")
-
-        st.markdown(
-            f"""
-            <div style='font-size:18px; margin-bottom:15px;'>
-                <b>Category:</b> 
-                <span style='background-color:{color}; color:#fff; padding:4px 10px; border-radius:10px;'><b>{category}</b></span>
-                <span style='background-color:{badge_color}; color:#fff; padding:4px 10px; border-radius:10px; margin-left:8px;'><b>{relevance}</b></span>
-            </div>
-            """, unsafe_allow_html=True
-        )
-
-        st.markdown(f"""
-        <div style="border: 1px solid #ccc; border-radius: 10px; overflow: hidden;">
-            <div style="background-color:{color}; color:#fff; padding:14px 18px;
-                        font-weight:bold; font-size:22px;">
-                {category}
-            </div>
-            <div style="padding:20px; font-size:18px; line-height:1.8; color:#000; background-color:#fafafa;">
-                <b style="font-size:19px;">Relevance:</b> 
-                <span style="background-color:{badge_color}; color:#fff;
-                            padding:6px 14px; border-radius:14px;
-                            font-size:16px; font-weight:bold;">
-                    {relevance}
-                </span>
-                <br><br>
-                <b style="font-size:19px;">Description:</b><br>
-                <span style="font-size:17px;">{desc}</span>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
-
-        # impact classes
-        impact_map = {
-            "Low": "#2ecc71",       # green
-            "Medium": "#f1c40f",    # yellow
-            "High": "#e67e22",      # orange
-            "Critical": "#e74c3c"   # red
-        }
-
-        import textwrap
-
-        def badge(label, value, icon=""):
-            if not value:
-                value = "N/A"
-            return textwrap.dedent(f"""
-            <div style='margin:2px 0; font-size:16px; display:flex; align-items:center;'>
-            <span style='font-weight:bold; color:#000; margin-right:6px;'>{icon} {label}:</span>
-            <span style="background-color:{impact_map.get(value,'#95a5a6')}; color:#fff;
-                        padding:4px 12px; border-radius:12px; font-weight:bold;">
-                {value}
-            </span>
-            </div>
-            """).strip()
-    
-        impact_html = "".join([
-            badge("MEDICAL EMERGENCY", row['class_impact_med'], "💊"),
-            badge("TECHNICAL ISSUE", row['class_impact_tech'], "⚙️"),
-            badge("LAND ASAP", row['class_impact_land'], "🛬"),
-        ])
-
-        st.markdown(f"""
-        <div style="margin:12px 0; padding:12px 8px 20px 8px;
-                    border:1px solid #ddd; border-radius:8px;
-                    background-color:#fdfdfd; font-size:16px;">
-            <b style="font-size:18px;">Impact Classes:</b>
-            {impact_html}
-        </div>
-        """, unsafe_allow_html=True)
+    # categoria non valida nel DB: nessun box (vedi report admin)
+    if cards["category_box"] is not None:
+        st.markdown(cards["category_header"], unsafe_allow_html=True)
+        st.markdown(cards["category_box"], unsafe_allow_html=True)
+        st.markdown(cards["impact"], unsafe_allow_html=True)
 
 with col2:
     st.subheader("📋 Feedback Evaluation")
@@ -275,73 +461,75 @@ with col2:
 
     # impact feedback
     st.markdown("**Perceived Impact?**")
-    impact_levels = ["Low", "Medium", "High", "Critical"]
-    impact_med = st.selectbox("🩺 Medical Emergency:", impact_levels, index=impact_levels.index(row['class_impact_med']))
-    impact_tech = st.selectbox("⚙️ Technical Issue:", impact_levels, index=impact_levels.index(row['class_impact_tech']))
-    impact_land = st.selectbox("🛬 Land ASAP:", impact_levels, index=impact_levels.index(row['class_impact_land']))
+    # indici precalcolati; un valore non valido nel DB (codice -1) parte da "Low"
+    impact_med = st.selectbox("🩺 Medical Emergency:", impact_levels, index=max(int(row['class_impact_med_code']), 0))
+    impact_tech = st.selectbox("⚙️ Technical Issue:", impact_levels, index=max(int(row['class_impact_tech_code']), 0))
+    impact_land = st.selectbox("🛬 Land ASAP:", impact_levels, index=max(int(row['class_impact_land_code']), 0))
 
     # notes (clear on next)
     notes = st.text_area("📝 Notes (optional)", 
-                         value=row["fb_notes"] if pd.notna(row["fb_notes"]) else "", 
-                         placeholder="Write a comment...", height=120, key=f"notes_{current_idx}")
+                         value=row_fb.get("fb_notes", ""), 
+                         placeholder="Write a comment...", height=120, key=f"notes_{row_key}")
 
     st.markdown("---")
 
     # --- BUTTONS ---
-    colb1, colb2, colb3, colb4 = st.columns(4)
+    colb1, colb2, colb3, colb4, colb5 = st.columns(5)
 
     if colb1.button("⬅️ Previous", disabled=(current_idx == 0)):
         st.session_state.index -= 1
         st.rerun()
 
     if colb2.button("💾 Save Feedback"):
-        df_user.at[current_idx, "fb_style"] = style
-        df_user.at[current_idx, "fb_category"] = 1 if correct_cat == "Yes" else 0
-        df_user.at[current_idx, "fb_corrected_category"] = chosen_cat if correct_cat == "No" and chosen_cat else ""
-        df_user.at[current_idx, "fb_realism"] = realism
-        df_user.at[current_idx, "fb_impact_med"] = impact_med
-        df_user.at[current_idx, "fb_impact_tech"] = impact_tech
-        df_user.at[current_idx, "fb_impact_land"] = impact_land
-        df_user.at[current_idx, "fb_notes"] = notes
-
-        df_user.to_csv(USER_CSV, index=False)
+        feedback = {
+            "fb_style": style,
+            "fb_category": 1 if correct_cat == "Yes" else 0,
+            "fb_corrected_category": chosen_cat if correct_cat == "No" and chosen_cat else "",
+            "fb_realism": realism,
+            "fb_impact_med": impact_med,
+            "fb_impact_tech": impact_tech,
+            "fb_impact_land": impact_land,
+            "fb_notes": notes,
+        }
+        overlay[row_key] = feedback
+        progress_index.mark(current_idx)
+
+        # accodato al writer in background: un record (journal) o un upsert (sqlite) al
+        # flush; anche il flag `done` dell'assegnazione
+        with timer.span("save"):
+            try:
+                saver.submit(store, {row_key: feedback})
+                saver.submit(notes_writer, {row_key: feedback})
+                if scheduler is not None:
+                    saver.submit(done_writer, {row_key: feedback})
+            except TimeoutError as exc:
+                st.error(f"⚠️ Saving is stuck, please try again: {exc}")
+                st.stop()
         st.success("✅ Feedback saved locally. Now click NEXT to continue.")
 
     if colb3.button("Next ➡️"):
         st.session_state.index += 1
         st.rerun()
 
-    import io
-
-    if colb4.button("🚪 Exit for today"):
-        # aggiorna indice e salva lato server
-        df_user["last_index"] = st.session_state.index
-        df_user.to_csv(USER_CSV, index=False)
-
-        # prepara CSV per download locale dell’utente
-        csv_buffer = io.StringIO()
-        df_user.to_csv(csv_buffer, index=False)
-
-        st.success("✅ Feedback saved. Download the file to keep it with you 👇")
-
-        st.download_button(
-            label="⬇️ Download your feedback",
-            data=csv_buffer.getvalue(),
-            file_name=USER_CSV,
-            mime="text/csv"
-        )
-
-        st.stop()
+    if colb4.button("⏭️ Next unannotated"):
+        next_pos = progress_index.next_unannotated(current_idx + 1,
+                                                   queue_names(queue_categories, queue_relevances))
+        if next_pos is None:
+            st.info("🎉 No unannotated NOTAMs left for the selected filters.")
+        else:
+            st.session_state.index = next_pos
+            st.rerun()
+
+    if colb5.button("🚪 Exit for today"):
+        exit_for_today(row_key)
+
+# --- progresso: contatori della bitmap, nessuna scansione del frame ---
+progress_bar.progress(progress_index.total_done/max(n_rows, 1))
+progress_caption.caption(f"{progress_index.total_done} of {n_rows} annotated"
+                         + (" · ✅ this NOTAM is already annotated" if progress_index.is_done(current_idx) else ""))
+remaining_table.dataframe(progress_index.remaining())
+with col2:
+    show_flush_status()
 
-    # ensure only relevant cols are kept
-    cols_keep = [
-        "e_line", "tag_type", "relevance_level",
-        "class_impact_med", "class_impact_tech", "class_impact_land",
-        "fb_style", "fb_category", "fb_corrected_category", "fb_realism",
-        "fb_impact_med", "fb_impact_tech", "fb_impact_land", "fb_notes"
-    ]
-    for col in cols_keep:
-        if col not in df_user.columns:
-            df_user[col] = ""
-
-    df_user[cols_keep].to_csv(USER_CSV, index=False)
+timer.finish()
+show_admin_timings()
@@ -0,0 +1,77 @@
+"""
+📑 Modalità batch: una pagina di NOTAM in una tabella modificabile
+==================================================================
+
+Per le categorie poco rilevanti (es. ADMINISTRATIVE, MILITARY) un pilota esperto può
+annotare una pagina intera di NOTAM in una griglia con le colonne `fb_*`, invece di
+fare edit / Save / Next riga per riga.
+
+La griglia sta in un form, quindi le modifiche non provocano rerun: "Save page"
+confronta la pagina modificata con quella di partenza e scrive in un'unica operazione
+(`store.save_many`) solo le righe cambiate.
+
+Le pagine si possono filtrare per `tag_type` e per rilevanza della categoria
+(`notam_general_relevance`).
+"""
+
+import numpy as np
+import pandas as pd
+
+from feedback_store import FB_COLS, NUMERIC_FB_COLS
+
+BATCH_PAGE_SIZE = 50
+
+# colonne di sola lettura mostrate accanto ai feedback
+INFO_COLS = ["notam_key", "tag_type", "category_relevance", "notam_text",
+             "class_impact_med", "class_impact_tech", "class_impact_land"]
+
+
+def filter_positions(df, categories=None, relevances=None):
+    """Posizioni (nel dataset) delle righe che passano i filtri; None/vuoto = nessun filtro."""
+    mask = np.ones(len(df), dtype=bool)
+    if categories:
+        mask &= df["tag_type"].isin(categories).to_numpy()
+    if relevances:
+        mask &= df["category_relevance"].isin(relevances).to_numpy()
+    return np.flatnonzero(mask)
+
+
+def page_frame(df, overlay, positions):
+    """Frame della pagina: colonne informative + fb_* dell'utente (vuoti se non annotata)."""
+    page = df.iloc[positions][INFO_COLS].astype(object).reset_index(drop=True)
+    fb = pd.DataFrame([overlay.get(key, {}) for key in page["notam_key"]],
+                      columns=FB_COLS, index=page.index)
+    for col in NUMERIC_FB_COLS:
+        # 2, 2.0 e "2" (CSV, journal, sqlite) sono lo stesso voto
+        fb[col] = pd.to_numeric(fb[col], errors="coerce").astype("Int64")
+    text_cols = [col for col in FB_COLS if col not in NUMERIC_FB_COLS]
+    fb[text_cols] = fb[text_cols].astype(object).where(fb[text_cols].notna(), None)
+    fb[text_cols] = fb[text_cols].replace("", None)
+    return page.join(fb)
+
+
+def _canonical(frame):
+    # confronto tra pagine indipendente da NaN / None / "" e dal tipo dei voti (2, 2.0, "2")
+    fb = frame[FB_COLS].copy()
+    for col in NUMERIC_FB_COLS:
+        fb[col] = pd.to_numeric(fb[col].replace("", None), errors="coerce").astype("Int64")
+    return fb.astype(object).where(fb.notna(), "").astype(str)
+
+
+def changed_feedback(original, edited):
+    """{notam_key: campi fb_*} per le righe modificate che hanno almeno un campo compilato."""
+    before, after = _canonical(original), _canonical(edited)
+    changed = (before != after).any(axis=1) & (after != "").any(axis=1)
+    feedback = {}
+    for idx in np.flatnonzero(changed.to_numpy()):
+        row = edited.iloc[idx]
+        fields = {}
+        for col in FB_COLS:
+            value = row[col]
+            if pd.isna(value):
+                value = ""
+            elif col in NUMERIC_FB_COLS:
+                value = int(value)
+            fields[col] = value
+        feedback[row["notam_key"]] = fields
+    return feedback
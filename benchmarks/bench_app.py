@@ -0,0 +1,140 @@
+"""
+📈 Benchmark di app.py rispetto alla dimensione del database
+============================================================
+
+Esegue l'app senza browser con `streamlit.testing.v1.AppTest` (secrets finti
+`APP_PASSWORD` / `DB_URL`, `db.csv` sintetico) e misura, per ogni dimensione:
+
+- cold_start : primo rerun completo (password + username, download nella cache,
+               conversione in Arrow e caricamento del db)
+- next       : rerun dopo "Next"
+- save       : rerun dopo "Save Feedback"
+- exit       : rerun dopo "Exit for today" (export del CSV)
+
+Ogni dimensione gira in un processo separato, così il picco di memoria (RSS massimo
+dopo ciascuno step) non è influenzato dalle dimensioni precedenti.
+
+Uso:
+    python benchmarks/bench_app.py                          # 1k, 10k, 100k, 1M righe
+    python benchmarks/bench_app.py --sizes 1000 10000 --json results.json
+    python benchmarks/bench_app.py --compare results.json   # segnala le regressioni
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(os.path.dirname(BENCH_DIR), "app.py")
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+STEPS = ["cold_start", "next", "save", "exit"]
+
+
+def _peak_rss_mb():
+    # ru_maxrss è in KB su Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _button(at, label):
+    return next(b for b in at.button if label in b.label)
+
+
+def run_single(n_rows, timeout):
+    """Benchmark di una dimensione, nel processo corrente. Restituisce {step: {wall_s, peak_rss_mb}}."""
+    from streamlit.testing.v1 import AppTest
+    from synthetic_db import write_synthetic_db
+
+    workdir = tempfile.mkdtemp(prefix=f"notam_bench_{n_rows}_")
+    os.chdir(workdir)  # l'app usa percorsi relativi (db.csv, feedback_<username>.csv)
+    write_synthetic_db("db.csv", n_rows)
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.secrets["APP_PASSWORD"] = "bench"
+    at.secrets["DB_URL"] = "file://" + os.path.abspath("db.csv")
+    results = {}
+
+    def measure(step, action):
+        start = time.perf_counter()
+        action()
+        wall = time.perf_counter() - start
+        if at.exception:
+            raise RuntimeError(f"{step}: {at.exception[0].message}")
+        results[step] = {"wall_s": round(wall, 4), "peak_rss_mb": round(_peak_rss_mb(), 1)}
+
+    at.run()
+    measure("cold_start", lambda: (at.text_input[0].input("bench").run(),
+                                   at.text_input[1].input("bench_user").run()))
+    measure("next", lambda: _button(at, "Next").click().run())
+    measure("save", lambda: _button(at, "Save").click().run())
+    measure("exit", lambda: _button(at, "Exit").click().run())
+    return results
+
+
+def run_all(sizes, timeout):
+    """Lancia ogni dimensione in un sottoprocesso e raccoglie i risultati."""
+    results = {}
+    for n_rows in sizes:
+        out = subprocess.run(
+            [sys.executable, __file__, "--single", str(n_rows), "--timeout", str(timeout)],
+            capture_output=True, text=True, check=True,
+        )
+        results[str(n_rows)] = json.loads(out.stdout.strip().splitlines()[-1])
+        print(_format_row(n_rows, results[str(n_rows)]), flush=True)
+    return results
+
+
+def _format_row(n_rows, steps):
+    cells = [f"{steps[s]['wall_s'] * 1000:9.1f} ms" for s in STEPS]
+    return f"{n_rows:>9,} rows | " + " | ".join(cells) + f" | peak {steps['exit']['peak_rss_mb']:8.1f} MB"
+
+
+def compare(results, baseline, tolerance):
+    """Step più lenti (o più pesanti in memoria) della baseline oltre la tolleranza."""
+    regressions = []
+    for size, steps in results.items():
+        for step, metrics in steps.items():
+            ref = baseline.get(size, {}).get(step)
+            if ref is None:
+                continue
+            for metric in ("wall_s", "peak_rss_mb"):
+                if metrics[metric] > ref[metric] * (1 + tolerance):
+                    regressions.append(f"{size} rows / {step} / {metric}: {ref[metric]} → {metrics[metric]}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless benchmark of app.py vs. dataset size.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline results file; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown (default 25%%)")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.single is not None:
+        print(json.dumps(run_single(args.single, args.timeout)))
+        return
+
+    print(f"{'size':>14} | " + " | ".join(f"{s:>12}" for s in STEPS) + " |")
+    results = run_all(args.sizes, args.timeout)
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            regressions = compare(results, json.load(fh), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+👥 Load test con più piloti simulati in parallelo
+=================================================
+
+Simula N sessioni di annotazione contemporanee contro app.py, ognuna con il proprio
+username e una passeggiata casuale di azioni Next / Save / Previous / Exit. Ogni pilota
+gira in un processo separato (AppTest usa un Runtime Streamlit per processo, quindi non
+si possono eseguire più sessioni in thread dello stesso processo), ma tutti lavorano
+sulla stessa cartella: i file feedback_*, il journal e il database SQLite sono condivisi
+esattamente come sul server.
+
+Ogni Save scrive nelle note un token univoco. Alla fine ogni pilota fa Exit e si
+controlla `feedback_<username>.csv`: file illeggibili (scritture corrotte) e righe il
+cui fb_notes non è l'ultimo token salvato (scritture perse). I piloti la cui sessione
+fallisce (eccezione nell'app) sono elencati a parte, senza interrompere il test.
+
+Uso:
+    python benchmarks/load_test.py --pilots 20 --actions 50 --rows 10000
+    python benchmarks/load_test.py --pilots 20 --backend sqlite
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bench_app import APP_PATH  # noqa: E402
+from synthetic_db import write_synthetic_db  # noqa: E402
+
+ACTIONS = ["next", "save", "previous", "exit"]
+ACTION_WEIGHTS = [0.45, 0.40, 0.10, 0.05]
+_CAPTION_RE = re.compile(r"NOTAM (\d+) of")
+
+
+def _button(at, label):
+    return next(b for b in at.button if label in b.label)
+
+
+def run_pilot(pilot_id, n_actions, backend, seed, timeout):
+    """Una sessione simulata. Restituisce (latenze per azione, {notam_key: ultimo token salvato})."""
+    from streamlit.testing.v1 import AppTest
+    from notam_loader import load_dataset
+
+    keys = load_dataset("db.csv").df["notam_key"]
+    rng = random.Random(seed)
+    username = f"pilot{pilot_id:03d}"
+    latencies = {action: [] for action in ACTIONS}
+    expected = {}
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.secrets["APP_PASSWORD"] = "load"
+    at.secrets["DB_URL"] = "file://" + os.path.abspath("db.csv")
+    at.secrets["FEEDBACK_BACKEND"] = backend
+    at.run()
+    at.text_input[0].input("load").run()
+    at.text_input[1].input(username).run()
+    if at.exception:
+        raise RuntimeError(f"{username} / login: {at.exception[0].message}")
+
+    def current_key():
+        position = int(_CAPTION_RE.search(at.caption[0].value).group(1)) - 1
+        return keys.iloc[position]
+
+    for seq in range(n_actions):
+        # l'ultima azione è sempre Exit, per compattare i feedback nel CSV
+        action = "exit" if seq == n_actions - 1 else rng.choices(ACTIONS, ACTION_WEIGHTS)[0]
+        if action == "previous" and _button(at, "Previous").disabled:
+            action = "next"
+        start = time.perf_counter()
+        if action == "save":
+            key, token = current_key(), f"{username}-{seq}"
+            at.text_area[0].input(token)
+            _button(at, "Save").click().run()
+            expected[key] = token
+        elif action == "exit":
+            _button(at, "Exit").click().run()
+            at.run()  # torna alla schermata di annotazione
+        else:
+            _button(at, action.capitalize()).click().run()
+        latencies[action].append(time.perf_counter() - start)
+        if at.exception:
+            raise RuntimeError(f"{username} / {action}: {at.exception[0].message}")
+    return username, latencies, expected
+
+
+def check_writes(results):
+    """Conta file corrotti e scritture perse confrontando i CSV con i token attesi."""
+    corrupted, lost = [], 0
+    for username, _, expected in results:
+        try:
+            saved = pd.read_csv(f"feedback_{username}.csv", usecols=["notam_key", "fb_notes"])
+        except Exception as exc:
+            corrupted.append(f"{username}: {exc}")
+            lost += len(expected)
+            continue
+        notes = saved.set_index("notam_key")["fb_notes"]
+        lost += sum(notes.get(key) != token for key, token in expected.items())
+    return corrupted, lost
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent pilots load test for app.py.")
+    parser.add_argument("--pilots", type=int, default=10)
+    parser.add_argument("--actions", type=int, default=40, help="actions per pilot")
+    parser.add_argument("--rows", type=int, default=10_000, help="synthetic db.csv size")
+    parser.add_argument("--backend", choices=["journal", "sqlite"], default="journal")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="notam_load_")
+    os.chdir(workdir)  # l'app usa percorsi relativi (db.csv, feedback_<username>.csv)
+    write_synthetic_db("db.csv", args.rows)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.pilots) as pool:
+        futures = [
+            pool.submit(run_pilot, i, args.actions, args.backend, args.seed + i, args.timeout)
+            for i in range(args.pilots)
+        ]
+        # un pilota fallito (es. all'avvio) viene riportato, gli altri vengono misurati lo stesso
+        results, failed = [], []
+        for i, future in enumerate(futures):
+            try:
+                results.append(future.result())
+            except Exception as exc:
+                failed.append(f"pilot{i:03d}: {exc}")
+    elapsed = time.perf_counter() - start
+
+    corrupted, lost = check_writes(results)
+    saves = sum(len(lat["save"]) for _, lat, _ in results)
+    print(f"{args.pilots} pilots × {args.actions} actions, {args.rows:,} rows, "
+          f"backend={args.backend} ({workdir})")
+    print(f"throughput: {saves / elapsed:.2f} annotations/s ({saves} saves in {elapsed:.1f} s)")
+    for action in ACTIONS:
+        samples = np.array([s for _, lat, _ in results for s in lat[action]]) * 1000
+        if len(samples):
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            print(f"  {action:<9} n={len(samples):<5} p50={p50:8.1f} ms  p95={p95:8.1f} ms  "
+                  f"p99={p99:8.1f} ms  max={samples.max():8.1f} ms")
+    print(f"corrupted files: {len(corrupted)}")
+    for line in corrupted:
+        print(f"  {line}")
+    print(f"lost writes: {lost}")
+    print(f"failed pilots: {len(failed)}")
+    for line in failed:
+        print(f"  {line}")
+    if corrupted or lost or failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+🧪 Database NOTAM sintetico per benchmark e load test
+=====================================================
+
+Genera un `db.csv` con la stessa struttura di quello reale (e_line con <Purpose>/<Topic>,
+tag_type dalle categorie di `notam_general_relevance`, relevance_level, class_impact_*).
+
+Uso:
+    python benchmarks/synthetic_db.py 100000 db.csv
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from notam_tags_rel_levels import notam_general_relevance, impact_levels  # noqa: E402
+
+LOCATIONS = ["LIRF", "LIMC", "EGLL", "LFPG", "EDDF", "KJFK", "LEMD", "EHAM"]
+SUBJECTS = ["RWY 16L/34R CLSD", "TWY B CLSD BTN A AND C", "ILS RWY 27 NOT AVBL",
+            "VOR/DME OUT OF SERVICE", "CRANE ERECTED PSN 414512N0121520E ELEV 250FT",
+            "ATC SER NOT AVBL", "RESTRICTED AREA ACTIVE GND-FL095", "APRON 3 CLSD FOR MAINT"]
+
+
+def make_synthetic_db(n_rows, seed=0):
+    """DataFrame sintetico di `n_rows` NOTAM (generato in modo vettoriale)."""
+    rng = np.random.default_rng(seed)
+    categories = np.array(list(notam_general_relevance))
+    tag_type = categories[rng.integers(len(categories), size=n_rows)]
+    relevance = {category: info["relevance"] for category, info in notam_general_relevance.items()}
+    ids = pd.Series(np.arange(n_rows)).astype(str)
+    location = pd.Series(np.array(LOCATIONS)[rng.integers(len(LOCATIONS), size=n_rows)])
+    subject = pd.Series(np.array(SUBJECTS)[rng.integers(len(SUBJECTS), size=n_rows)])
+
+    e_line = ("<Purpose>Synthetic scenario " + ids + "</Purpose><Topic>" + pd.Series(tag_type)
+              + "</Topic> A) " + location + " E) " + subject + " REF " + ids)
+    levels = np.array(impact_levels)
+    return pd.DataFrame({
+        "e_line": e_line,
+        "tag_type": tag_type,
+        "relevance_level": pd.Series(tag_type).map(relevance),
+        "class_impact_med": levels[rng.integers(4, size=n_rows)],
+        "class_impact_tech": levels[rng.integers(4, size=n_rows)],
+        "class_impact_land": levels[rng.integers(4, size=n_rows)],
+    })
+
+
+def write_synthetic_db(path, n_rows, seed=0):
+    make_synthetic_db(n_rows, seed=seed).to_csv(path, index=False)
+    return path
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    out = sys.argv[2] if len(sys.argv) > 2 else "db.csv"
+    write_synthetic_db(out, n)
+    print(f"{n} synthetic NOTAMs → {out}")
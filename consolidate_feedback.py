@@ -0,0 +1,202 @@
+"""
+🧮 Consolidamento dei feedback a fine campagna
+==============================================
+
+Legge tutti i file `feedback_<username>.csv` ricevuti dai piloti (ognuno è una copia
+completa del database) a blocchi, in parallelo su un pool di processi, e tiene solo le
+righe annotate. Il risultato è una tabella in formato lungo (notam_key, user, fb_*)
+più le statistiche di accordo tra annotatori:
+
+- kappa di Fleiss su `fb_style` e `fb_realism`, per NOTAM, per categoria e globale
+- matrice di confusione `tag_type` proposto → categoria indicata dal pilota
+- differenze di impatto percepito (`fb_impact_*`) rispetto a `class_impact_*`
+
+Con `--index search.sqlite` le note di tutti i piloti (e, con `--db`, il database)
+finiscono anche nell'indice di ricerca full-text (vedi `search_index`).
+
+Uso:
+    python consolidate_feedback.py feedback_*.csv --out-dir consolidated/
+    python consolidate_feedback.py --sqlite feedback.sqlite --db db.csv --out-dir consolidated/
+    python consolidate_feedback.py feedback_*.csv --db db.csv --index search.sqlite
+"""
+
+import argparse
+import glob
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from feedback_store import FB_COLS, annotated_mask
+from notam_loader import load_dataset, notam_keys
+from notam_tags_rel_levels import impact_levels as IMPACT_LEVELS
+from search_index import SearchIndex
+
+IMPACT_DIMS = ["med", "tech", "land"]
+REF_COLS = ["tag_type"] + [f"class_impact_{dim}" for dim in IMPACT_DIMS]
+AGREEMENT_COLS = ["fb_style", "fb_realism"]
+
+_USER_FILE_RE = re.compile(r"feedback_(.+)\.csv$")
+
+
+def username_from_path(path):
+    match = _USER_FILE_RE.search(os.path.basename(path))
+    return match.group(1) if match else os.path.splitext(os.path.basename(path))[0]
+
+
+def read_user_file(path, chunksize=50_000):
+    """Righe annotate di un file feedback: (long, ref) con ref = tag_type / class_impact_* per chiave."""
+    wanted = set(FB_COLS) | set(REF_COLS) | {"notam_key", "e_line"}
+    parts = []
+    for chunk in pd.read_csv(path, usecols=lambda col: col in wanted, chunksize=chunksize):
+        chunk = chunk.loc[annotated_mask(chunk)]
+        if "notam_key" not in chunk.columns:
+            chunk = chunk.assign(notam_key=notam_keys(chunk))
+        parts.append(chunk.drop(columns=["e_line"], errors="ignore"))
+    annotated = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=["notam_key"])
+    annotated = annotated.reindex(columns=["notam_key"] + FB_COLS + REF_COLS)
+    annotated = annotated.drop_duplicates("notam_key", keep="last")
+
+    long = annotated[["notam_key"] + FB_COLS].copy()
+    long.insert(1, "user", username_from_path(path))
+    return long, annotated[["notam_key"] + REF_COLS]
+
+
+def read_sqlite(db_path):
+    """Tabella lunga direttamente dal backend SQLite dei feedback."""
+    with sqlite3.connect(db_path) as conn:
+        return pd.read_sql_query(
+            f"SELECT notam_key, username AS user, {', '.join(FB_COLS)} FROM feedback", conn
+        )
+
+
+def consolidate(paths, workers=None, chunksize=50_000):
+    """Legge i file in parallelo e restituisce (long, ref)."""
+    longs, refs = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for long, ref in pool.map(read_user_file, paths, [chunksize] * len(paths)):
+            longs.append(long)
+            refs.append(ref)
+    long = pd.concat(longs, ignore_index=True) if longs else pd.DataFrame(columns=["notam_key", "user"] + FB_COLS)
+    ref = pd.concat(refs, ignore_index=True) if refs else pd.DataFrame(columns=["notam_key"] + REF_COLS)
+    return long, ref.dropna(subset=["tag_type"]).drop_duplicates("notam_key")
+
+
+def _item_agreement(long, col):
+    """Conteggi per NOTAM × valore e accordo osservato P_i (solo NOTAM con almeno 2 annotatori)."""
+    values = pd.to_numeric(long[col], errors="coerce")
+    counts = (long.assign(value=values).dropna(subset=["value"])
+              .groupby(["notam_key", "value"]).size().unstack(fill_value=0))
+    n = counts.sum(axis=1)
+    counts, n = counts[n >= 2], n[n >= 2]
+    p_i = ((counts ** 2).sum(axis=1) - n) / (n * (n - 1))
+    return counts, p_i
+
+
+def fleiss_kappa(counts, p_i, groups):
+    """Kappa di Fleiss per gruppo di NOTAM (vettoriale sui gruppi)."""
+    p_j = counts.groupby(groups).sum()
+    p_j = p_j.div(p_j.sum(axis=1), axis=0)
+    p_e = (p_j ** 2).sum(axis=1)
+    p_bar = p_i.groupby(groups).mean()
+    return (p_bar - p_e) / (1 - p_e)
+
+
+def agreement_stats(long, ref):
+    """Accordo per NOTAM (P_i) e kappa di Fleiss per categoria (più la riga "ALL")."""
+    tag = ref.set_index("notam_key")["tag_type"]
+    per_notam = long.groupby("notam_key").size().rename("n_annotators").to_frame()
+    kappas = {}
+    for col in AGREEMENT_COLS:
+        counts, p_i = _item_agreement(long, col)
+        per_notam[f"{col}_agreement"] = p_i
+        item_tag = tag.reindex(counts.index).fillna("UNKNOWN")
+        everything = pd.Series("ALL", index=counts.index)
+        kappas[f"{col}_kappa"] = pd.concat([
+            fleiss_kappa(counts, p_i, item_tag),
+            fleiss_kappa(counts, p_i, everything),
+        ])
+    per_category = pd.DataFrame(kappas)
+    per_category.index.name = "tag_type"
+    return per_notam.join(tag), per_category
+
+
+def category_confusion(long, ref):
+    """Matrice di confusione: tag_type proposto → categoria indicata dal pilota."""
+    merged = long.merge(ref[["notam_key", "tag_type"]], on="notam_key", how="inner")
+    corrected = merged["fb_corrected_category"].fillna("").astype(str).str.strip()
+    chosen = corrected.where(corrected != "", merged["tag_type"])
+    return pd.crosstab(merged["tag_type"].rename("tag_type"), chosen.rename("pilot_category"))
+
+
+def impact_deltas(long, ref):
+    """Differenza (livelli) tra impatto percepito e class_impact_*, per NOTAM e per categoria."""
+    merged = long.merge(ref, on="notam_key", how="inner")
+    levels = pd.CategoricalDtype(IMPACT_LEVELS, ordered=True)
+    deltas = merged[["notam_key", "tag_type"]].copy()
+    for dim in IMPACT_DIMS:
+        given = merged[f"fb_impact_{dim}"].astype(levels).cat.codes
+        proposed = merged[f"class_impact_{dim}"].astype(levels).cat.codes
+        valid = (given >= 0) & (proposed >= 0)
+        deltas[f"delta_{dim}"] = (given - proposed).where(valid)
+    delta_cols = [f"delta_{dim}" for dim in IMPACT_DIMS]
+    per_notam = deltas.groupby("notam_key")[delta_cols].mean()
+    per_category = deltas.groupby("tag_type")[delta_cols].agg(["mean", "count"])
+    per_category.columns = [f"{col}_{stat}" for col, stat in per_category.columns]
+    return per_notam, per_category
+
+
+def index_notes(long, index_path, dataset=None):
+    """Note di tutti i piloti nell'indice di ricerca (e il database, se è una nuova versione)."""
+    index = SearchIndex(index_path)
+    if dataset is not None:
+        index.ensure_dataset(dataset)
+    notes = long.assign(fb_notes=long["fb_notes"].fillna("").astype(str).str.strip())
+    for user, rows in notes.groupby("user"):
+        index.update_notes(user, dict(zip(rows["notam_key"], rows["fb_notes"])))
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consolidate pilot feedback files and compute agreement.")
+    parser.add_argument("files", nargs="*", help="feedback_<username>.csv files (default: feedback_*.csv)")
+    parser.add_argument("--sqlite", help="read feedback from the SQLite backend instead of CSV files")
+    parser.add_argument("--db", help="NOTAM database (db.csv) used for tag_type / class_impact_*")
+    parser.add_argument("--out-dir", default="consolidated")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=50_000)
+    parser.add_argument("--index", help="also update this full-text search index (SQLite FTS5)")
+    args = parser.parse_args(argv)
+
+    if args.sqlite:
+        long, ref = read_sqlite(args.sqlite), None
+    else:
+        paths = args.files or sorted(glob.glob("feedback_*.csv"))
+        long, ref = consolidate(paths, workers=args.workers, chunksize=args.chunksize)
+    dataset = load_dataset(args.db) if args.db else None
+    if dataset is not None:
+        # categorici del loader → stringhe semplici (crosstab/groupby solo sui valori presenti)
+        ref = dataset.df[["notam_key"] + REF_COLS].astype(object)
+    if ref is None:
+        parser.error("--db is required with --sqlite")
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    out = lambda name: os.path.join(args.out_dir, name)
+
+    long.to_csv(out("feedback_long.csv"), index=False)
+    per_notam, per_category = agreement_stats(long, ref)
+    impact_notam, impact_category = impact_deltas(long, ref)
+    per_notam.join(impact_notam).to_csv(out("agreement_per_notam.csv"))
+    per_category.join(impact_category, how="outer").to_csv(out("agreement_per_category.csv"))
+    category_confusion(long, ref).to_csv(out("category_confusion.csv"))
+    if args.index:
+        index_notes(long, args.index, dataset)
+
+    print(f"{len(long)} annotations from {long['user'].nunique()} users "
+          f"on {long['notam_key'].nunique()} NOTAMs → {args.out_dir}/")
+
+
+if __name__ == "__main__":
+    main()
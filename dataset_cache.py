@@ -0,0 +1,192 @@
+"""
+🗄️ Cache versionata del database NOTAM
+======================================
+
+Gestisce il download di `db.csv` da `DB_URL` (Google Drive, http/https, `file://` o
+percorso locale) in modo che un download interrotto non venga mai usato:
+
+1. il file viene scaricato in un file temporaneo nella cartella della cache;
+2. se è configurato `DB_SHA256` il checksum deve coincidere, altrimenti il file è scartato;
+3. il file viene rinominato atomicamente in `db-<hash>.csv` (una copia per versione);
+4. ogni versione viene convertita una sola volta in `db-<hash>.arrow` (Arrow IPC,
+   con colonne derivate, chiavi, codifica e report dei valori non validi già
+   calcolati) che `notam_loader` apre in memory-map;
+5. `current.json` (anch'esso scritto atomicamente) indica la versione in uso.
+
+La sorgente viene ricontrollata al massimo ogni `refresh_seconds`: se il contenuto è
+cambiato diventa la nuova versione corrente, se il download fallisce si continua con
+quella già in cache.
+"""
+
+import glob
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from urllib.parse import unquote, urlparse
+
+import pandas as pd
+
+from notam_loader import (ARROW_SUFFIX, ISSUES_KEY, SOURCE_HASH_KEY, file_checksum, issues_metadata,
+                          prepare_dataset)
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = "current.json"
+KEEP_VERSIONS = 3
+
+_lock = threading.Lock()
+_last_check = {}      # (url, cache_dir) -> (monotonic time, arrow path)
+_refresh_locks = {}   # (url, cache_dir) -> lock di chi sta aggiornando la sorgente
+
+
+def _download(url, dest):
+    parsed = urlparse(url)
+    if parsed.scheme == "file":
+        shutil.copyfile(unquote(parsed.path), dest)
+    elif not parsed.scheme and os.path.exists(url):
+        shutil.copyfile(url, dest)
+    else:
+        import gdown
+
+        if gdown.download(url, dest, quiet=True) is None:
+            raise IOError(f"Download failed: {url}")
+
+
+def _write_json_atomic(data, path):
+    # file temporaneo univoco: più processi possono scrivere current.json insieme
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".json.tmp")
+    try:
+        with os.fdopen(fd, "w") as fh:
+            json.dump(data, fh)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def convert_to_arrow(csv_path, arrow_path, version):
+    """Converte una versione del CSV nel formato colonnare, con colonne derivate, chiavi e codifica.
+
+    I categorici diventano dizionari Arrow; il report dei valori non validi va nei metadati.
+    """
+    import pyarrow as pa
+
+    df, issues = prepare_dataset(pd.read_csv(csv_path))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        SOURCE_HASH_KEY: version,
+        ISSUES_KEY: issues_metadata(issues),
+    })
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(arrow_path), suffix=".arrow.tmp")
+    os.close(fd)
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, arrow_path)
+
+
+def _read_current(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, CURRENT_FILE)) as fh:
+            current = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if not os.path.exists(os.path.join(cache_dir, current["arrow"])):
+        return None
+    return current
+
+
+def _prune(cache_dir, keep):
+    versions = sorted(glob.glob(os.path.join(cache_dir, "db-*.csv")), key=os.path.getmtime, reverse=True)
+    for csv_path in versions[keep:]:
+        for path in (csv_path, csv_path[:-len(".csv")] + ARROW_SUFFIX):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def refresh_dataset(url, cache_dir="db_cache", expected_sha256=None, keep=KEEP_VERSIONS):
+    """Scarica la sorgente, la verifica e la rende versione corrente. Restituisce il percorso .arrow."""
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".download")
+    os.close(fd)
+    try:
+        _download(url, tmp_path)
+        if os.path.getsize(tmp_path) == 0:
+            raise IOError(f"Empty download: {url}")
+        version = file_checksum(tmp_path)
+        if expected_sha256 and version != expected_sha256.lower():
+            raise ValueError(f"Checksum mismatch for {url}: expected {expected_sha256}, got {version}")
+
+        stem = os.path.join(cache_dir, f"db-{version[:16]}")
+        csv_path = f"{stem}.csv"
+        if os.path.exists(csv_path):
+            # versione già in cache: la si segna come la più recente per _prune
+            os.remove(tmp_path)
+            os.utime(csv_path)
+        else:
+            os.replace(tmp_path, csv_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    arrow_path = stem + ARROW_SUFFIX
+    if not os.path.exists(arrow_path):
+        convert_to_arrow(csv_path, arrow_path, version)
+    _write_json_atomic({
+        "sha256": version,
+        "csv": os.path.basename(csv_path),
+        "arrow": os.path.basename(arrow_path),
+        "checked_at": time.time(),
+    }, os.path.join(cache_dir, CURRENT_FILE))
+    _prune(cache_dir, keep)
+    return arrow_path
+
+
+def ensure_dataset(url, cache_dir="db_cache", expected_sha256=None, refresh_seconds=3600):
+    """Percorso della versione corrente (.arrow), ricontrollando la sorgente al più ogni `refresh_seconds`.
+
+    Il download avviene fuori dal lock del modulo e in un solo thread per sorgente: nel
+    frattempo le altre sessioni continuano con la versione già in cache (solo al primo
+    avvio, senza cache, aspettano il download).
+    """
+    key = (url, os.path.abspath(cache_dir))
+    with _lock:
+        checked = _last_check.get(key)
+        if checked is not None and time.monotonic() - checked[0] < refresh_seconds:
+            return checked[1]
+        current = _read_current(cache_dir)
+        if current is not None and time.time() - current["checked_at"] < refresh_seconds:
+            path = os.path.join(cache_dir, current["arrow"])
+            _last_check[key] = (time.monotonic(), path)
+            return path
+        refresh_lock = _refresh_locks.setdefault(key, threading.Lock())
+
+    if current is not None:
+        if not refresh_lock.acquire(blocking=False):
+            # un altro thread sta già scaricando: si usa la versione in cache
+            return os.path.join(cache_dir, current["arrow"])
+    else:
+        refresh_lock.acquire()
+    try:
+        with _lock:
+            checked = _last_check.get(key)
+            if checked is not None and time.monotonic() - checked[0] < refresh_seconds:
+                # aggiornata da chi aveva il lock prima di noi
+                return checked[1]
+        try:
+            path = refresh_dataset(url, cache_dir, expected_sha256)
+        except Exception:
+            current = _read_current(cache_dir)
+            if current is None:
+                raise
+            logger.exception("Dataset refresh failed, keeping version %s", current["sha256"][:16])
+            path = os.path.join(cache_dir, current["arrow"])
+        with _lock:
+            _last_check[key] = (time.monotonic(), path)
+        return path
+    finally:
+        refresh_lock.release()
@@ -0,0 +1,207 @@
+"""
+🎯 Export dei record di training per il reinforcement learning
+==============================================================
+
+Trasforma i feedback dei piloti in record pronti per il training del generatore di NOTAM:
+ogni record contiene l'e_line originale, la proposta del generatore (`tag_type`,
+`class_impact_*`) e le correzioni del pilota come campi di reward / preferenza.
+
+L'export è in streaming: i file vengono letti a blocchi e ogni blocco viene scritto
+subito (JSONL e/o un row group Parquet), quindi la memoria non dipende dalla dimensione
+del corpus. È anche incrementale: per ogni (user, notam_key) si ricorda in un piccolo
+database SQLite l'hash dei campi fb_* già esportati, e a ogni esecuzione vengono scritti
+solo i record nuovi o modificati, in file nuovi `rl_<timestamp>.jsonl` / `.parquet`.
+Chi consuma l'export tiene, per ogni (user, notam_key), il record con `exported_at` più recente.
+
+Uso:
+    python export_rl.py feedback_*.csv --out-dir rl_export/
+    python export_rl.py --sqlite feedback.sqlite --db db.csv --out-dir rl_export/
+"""
+
+import argparse
+import glob
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from consolidate_feedback import username_from_path
+from feedback_store import FB_COLS, annotated_mask
+from notam_loader import notam_keys
+
+IMPACT_DIMS = ["med", "tech", "land"]
+SOURCE_COLS = ["notam_key", "e_line", "tag_type"] + [f"class_impact_{dim}" for dim in IMPACT_DIMS]
+NUMERIC_FB_COLS = ["fb_style", "fb_category", "fb_realism"]
+
+RECORD_COLS = {
+    "notam_key": "string", "user": "string", "e_line": "string", "tag_type": "string",
+    "class_impact_med": "string", "class_impact_tech": "string", "class_impact_land": "string",
+    "reward_style": "float64", "reward_category": "float64", "reward_realism": "float64",
+    "corrected_category": "string", "chosen_category": "string",
+    "impact_med": "string", "impact_tech": "string", "impact_land": "string",
+    "notes": "string", "feedback_hash": "string", "exported_at": "float64",
+}
+
+
+def iter_csv_chunks(paths, chunksize=20_000):
+    """Righe annotate dei file feedback, un blocco alla volta, con la colonna `user`."""
+    wanted = set(SOURCE_COLS) | set(FB_COLS)
+    for path in paths:
+        user = username_from_path(path)
+        for chunk in pd.read_csv(path, usecols=lambda col: col in wanted, chunksize=chunksize):
+            chunk = chunk.loc[annotated_mask(chunk)]
+            if chunk.empty:
+                continue
+            if "notam_key" not in chunk.columns:
+                chunk = chunk.assign(notam_key=notam_keys(chunk))
+            yield chunk.assign(user=user)
+
+
+def iter_sqlite_chunks(sqlite_path, db_path, chunksize=20_000):
+    """Scorre db.csv a blocchi e per ogni blocco legge dal backend SQLite i feedback delle sue chiavi."""
+    with sqlite3.connect(sqlite_path) as conn:
+        for chunk in pd.read_csv(db_path, chunksize=chunksize):
+            chunk = chunk.assign(notam_key=notam_keys(chunk)).drop_duplicates("notam_key")
+            keys = chunk["notam_key"].tolist()
+            fb = pd.read_sql_query(
+                f"SELECT notam_key, username AS user, {', '.join(FB_COLS)} FROM feedback "
+                f"WHERE notam_key IN ({', '.join('?' * len(keys))})",
+                conn, params=keys,
+            )
+            if not fb.empty:
+                yield chunk.reindex(columns=SOURCE_COLS).merge(fb, on="notam_key")
+
+
+def _binary_reward(values, positive):
+    numeric = pd.to_numeric(values, errors="coerce")
+    return (numeric == positive).astype("float64").where(numeric.notna())
+
+
+def to_records(chunk):
+    """Record di training (colonne piatte, tipi fissi) da un blocco di feedback."""
+    chunk = chunk.reindex(columns=["user"] + SOURCE_COLS + FB_COLS)
+    corrected = chunk["fb_corrected_category"].fillna("").astype(str).str.strip()
+    # forma canonica dei campi fb_* (2, 2.0 e "2" sono lo stesso voto) per un hash stabile
+    fb = chunk[FB_COLS].astype(object)
+    for col in NUMERIC_FB_COLS:
+        fb[col] = pd.to_numeric(fb[col], errors="coerce").astype("Int64")
+    fb_text = fb.astype(str).where(fb.notna(), "")
+
+    records = pd.DataFrame({
+        "notam_key": chunk["notam_key"],
+        "user": chunk["user"],
+        "e_line": chunk["e_line"],
+        "tag_type": chunk["tag_type"],
+        "class_impact_med": chunk["class_impact_med"],
+        "class_impact_tech": chunk["class_impact_tech"],
+        "class_impact_land": chunk["class_impact_land"],
+        "reward_style": _binary_reward(chunk["fb_style"], 2),
+        "reward_category": _binary_reward(chunk["fb_category"], 1),
+        "reward_realism": _binary_reward(chunk["fb_realism"], 2),
+        "corrected_category": corrected,
+        # preferenza: la categoria scelta dal pilota (la proposta se l'ha confermata)
+        "chosen_category": corrected.where(corrected != "", chunk["tag_type"]),
+        "impact_med": chunk["fb_impact_med"],
+        "impact_tech": chunk["fb_impact_tech"],
+        "impact_land": chunk["fb_impact_land"],
+        "notes": fb_text["fb_notes"],
+        "feedback_hash": pd.util.hash_pandas_object(fb_text, index=False).map("{:016x}".format),
+        "exported_at": time.time(),
+    })
+    return records.drop_duplicates(["user", "notam_key"], keep="last").astype(RECORD_COLS)
+
+
+class ExportState:
+    """Hash dei feedback già esportati per (user, notam_key), su SQLite per non tenerli in memoria."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS exported ("
+            "user TEXT NOT NULL, notam_key TEXT NOT NULL, feedback_hash TEXT NOT NULL, "
+            "PRIMARY KEY (user, notam_key)) WITHOUT ROWID"
+        )
+
+    def changed(self, records):
+        """Solo i record mai esportati o con feedback diverso dall'ultimo export."""
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS batch (user TEXT, notam_key TEXT)")
+        self.conn.execute("DELETE FROM batch")
+        self.conn.executemany("INSERT INTO batch VALUES (?, ?)",
+                              records[["user", "notam_key"]].itertuples(index=False))
+        previous = pd.read_sql_query(
+            "SELECT e.user, e.notam_key, e.feedback_hash AS previous_hash FROM exported e "
+            "JOIN batch b ON e.user = b.user AND e.notam_key = b.notam_key",
+            self.conn,
+        )
+        merged = records.merge(previous, on=["user", "notam_key"], how="left")
+        return records[(merged["previous_hash"].fillna("") != merged["feedback_hash"]).to_numpy(dtype=bool)]
+
+    def mark(self, records):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO exported VALUES (?, ?, ?) "
+                "ON CONFLICT (user, notam_key) DO UPDATE SET feedback_hash = excluded.feedback_hash",
+                records[["user", "notam_key", "feedback_hash"]].itertuples(index=False),
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+def export(chunks, out_dir, formats=("jsonl", "parquet")):
+    """Scrive i record nuovi o modificati, blocco per blocco. Restituisce il numero di record."""
+    os.makedirs(out_dir, exist_ok=True)
+    state = ExportState(os.path.join(out_dir, "_export_state.sqlite"))
+    stem = os.path.join(out_dir, time.strftime("rl_%Y%m%dT%H%M%S"))
+    parquet_writer = None
+    if "parquet" in formats:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    total = 0
+    try:
+        for chunk in chunks:
+            records = state.changed(to_records(chunk))
+            if records.empty:
+                continue
+            if "jsonl" in formats:
+                with open(f"{stem}.jsonl", "a", encoding="utf-8") as fh:
+                    records.to_json(fh, orient="records", lines=True, force_ascii=False)
+            if "parquet" in formats:
+                table = pa.Table.from_pandas(records, preserve_index=False)
+                if parquet_writer is None:
+                    parquet_writer = pq.ParquetWriter(f"{stem}.parquet", table.schema)
+                parquet_writer.write_table(table)
+            state.mark(records)
+            total += len(records)
+    finally:
+        if parquet_writer is not None:
+            parquet_writer.close()
+        state.close()
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incremental export of RL training records.")
+    parser.add_argument("files", nargs="*", help="feedback_<username>.csv files (default: feedback_*.csv)")
+    parser.add_argument("--sqlite", help="read feedback from the SQLite backend (requires --db)")
+    parser.add_argument("--db", help="NOTAM database (db.csv), used with --sqlite")
+    parser.add_argument("--out-dir", default="rl_export")
+    parser.add_argument("--format", nargs="+", choices=["jsonl", "parquet"], default=["jsonl", "parquet"])
+    parser.add_argument("--chunksize", type=int, default=20_000)
+    args = parser.parse_args(argv)
+
+    if args.sqlite:
+        if not args.db:
+            parser.error("--db is required with --sqlite")
+        chunks = iter_sqlite_chunks(args.sqlite, args.db, chunksize=args.chunksize)
+    else:
+        paths = args.files or sorted(glob.glob("feedback_*.csv"))
+        chunks = iter_csv_chunks(paths, chunksize=args.chunksize)
+
+    total = export(chunks, args.out_dir, formats=args.format)
+    print(f"{total} new or changed records exported → {args.out_dir}/")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+💾 Salvataggio dei feedback
+===========================
+
+Ogni "Save Feedback" aggiunge un solo record JSON al journal dell'utente
+(`feedback_<username>.journal`) invece di riscrivere l'intero CSV.
+Il journal viene compattato nel file completo `feedback_<username>.csv` solo
+all'uscita / export, unendo il CSV precedente e tutti i record del journal (anche
+quelli di altre schede dello stesso utente); al caricamento successivo i record
+ancora presenti nel journal vengono riapplicati, così un crash non fa perdere i
+feedback salvati.
+
+In alternativa (`FEEDBACK_BACKEND = "sqlite"` nei secrets) i feedback di tutti gli
+utenti finiscono in un database SQLite locale in modalità WAL, con chiave
+(username, notam_key): letture e scritture puntuali sulla riga corrente, nessun
+conflitto se lo stesso pilota ha due schede aperte, query trasversali tra utenti.
+Il CSV resta il formato di export/import per download e upload.
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+import pandas as pd
+
+from notam_loader import DERIVED_COLS, notam_keys
+
+FB_COLS = [
+    "fb_style", "fb_category", "fb_corrected_category", "fb_realism",
+    "fb_impact_med", "fb_impact_tech", "fb_impact_land", "fb_notes",
+]
+# voti numerici: nel CSV tornano float (2.0), nel journal / sqlite interi
+NUMERIC_FB_COLS = ["fb_style", "fb_category", "fb_realism"]
+
+
+def _write_csv_atomic(df, path):
+    # scrive su file temporaneo e rinomina: il CSV non resta mai a metà; il nome è
+    # univoco perché due schede dello stesso utente possono esportare insieme
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".csv.tmp")
+    try:
+        with os.fdopen(fd, "w", newline="") as fh:
+            df.to_csv(fh, index=False)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def annotated_mask(df):
+    """Righe con almeno un campo fb_* compilato."""
+    values = df[[col for col in FB_COLS if col in df.columns]]
+    return (values.notna() & (values.astype(str) != "")).any(axis=1)
+
+
+def overlay_from_frame(df_feedback):
+    """Solo le righe annotate di un file feedback: {notam_key: campi fb_*}.
+
+    I file senza `notam_key` (versioni precedenti) ricevono la chiave da e_line + tag_type.
+    """
+    annotated = df_feedback.loc[annotated_mask(df_feedback)]
+    if "notam_key" not in annotated.columns:
+        annotated = annotated.assign(notam_key=notam_keys(annotated))
+    fb = annotated.reindex(columns=FB_COLS).astype(object)
+    for col in NUMERIC_FB_COLS:
+        fb[col] = pd.to_numeric(fb[col], errors="coerce").astype("Int64").astype(object)
+    fb = fb.where(fb.notna(), "")
+    return dict(zip(annotated["notam_key"], fb.to_dict("records")))
+
+
+def read_overlay(source, chunksize=10_000):
+    """Legge a blocchi un CSV feedback tenendo in memoria solo le righe annotate.
+
+    Restituisce (overlay, progress) dove `progress` contiene l'ultimo `last_key`
+    (o `last_index` per i file di versioni precedenti) trovato nel file.
+    """
+    wanted = set(FB_COLS) | {"notam_key", "e_line", "tag_type", "last_key", "last_index"}
+    overlay, progress = {}, {}
+    for chunk in pd.read_csv(source, usecols=lambda col: col in wanted, chunksize=chunksize):
+        overlay.update(overlay_from_frame(chunk))
+        for col in ("last_key", "last_index"):
+            if col in chunk.columns and chunk[col].notna().any():
+                progress[col] = chunk[col].dropna().iloc[-1]
+    return overlay, progress
+
+
+def materialize(df_base, overlay):
+    """Frame completo (dataset + feedback dell'utente), da costruire solo per l'export."""
+    fb = pd.DataFrame.from_dict(overlay, orient="index", columns=FB_COLS).astype(object)
+    merged = df_base.drop(columns=FB_COLS, errors="ignore").join(fb, on="notam_key")
+    merged[FB_COLS] = merged[FB_COLS].astype(object).where(merged[FB_COLS].notna(), "")
+    return merged
+
+
+def export_frame(df_base, overlay, last_key=None):
+    """Frame da esportare nel CSV: dataset originale + feedback + `last_key`."""
+    df_out = materialize(df_base, overlay).drop(columns=DERIVED_COLS, errors="ignore")
+    df_out["last_key"] = last_key
+    return df_out
+
+
+def _read_journal(path):
+    # {chiave: campi fb_*}, l'ultimo record per chiave vince
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # riga troncata da un crash durante la scrittura
+                continue
+            records[record["key"]] = {col: record.get(col, "") for col in FB_COLS}
+    return records
+
+
+class JournalFeedbackStore:
+    """Journal append-only dei feedback di un utente."""
+
+    def __init__(self, username, directory="."):
+        self.username = username
+        self.csv_path = os.path.join(directory, f"feedback_{username}.csv")
+        self.journal_path = os.path.join(directory, f"feedback_{username}.journal")
+        # journal in corso di compattazione (resta solo se l'export è stato interrotto)
+        self.compacting_path = f"{self.journal_path}.compacting"
+        self._records = None  # cache in memoria del journal, caricata al primo get()
+
+    def save(self, key, fields):
+        """Aggiunge un record (chiave riga, campi fb_*, timestamp) al journal."""
+        self.save_many({key: fields})
+
+    def save_many(self, feedback):
+        """Più record {chiave: campi fb_*} in un'unica scrittura (un solo fsync)."""
+        now = time.time()
+        lines = []
+        for key, fields in feedback.items():
+            record = {"key": key, "ts": now}
+            record.update({col: fields.get(col, "") for col in FB_COLS})
+            lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+        with open(self.journal_path, "a", encoding="utf-8") as fh:
+            fh.write("".join(lines))
+            fh.flush()
+            os.fsync(fh.fileno())
+        if self._records is not None:
+            for key, fields in feedback.items():
+                self._records[key] = {col: fields.get(col, "") for col in FB_COLS}
+
+    def replay(self):
+        """Legge il journal: {chiave: campi fb_*}, l'ultimo record per chiave vince."""
+        records = _read_journal(self.compacting_path)
+        records.update(_read_journal(self.journal_path))
+        return records
+
+    def get(self, key):
+        if self._records is None:
+            self._records = self.replay()
+        return self._records.get(key)
+
+    def compact(self, df_base, overlay, last_key=None):
+        """Scrive il CSV completo e svuota il journal (da chiamare su exit / export).
+
+        Il CSV unisce l'export precedente e tutti i record del journal, anche quelli
+        salvati da altre schede; `overlay` (la sessione) copre solo le chiavi che non
+        compaiono altrove. Restituisce il frame esportato.
+        """
+        # il journal viene spostato da parte prima di leggerlo: i record che arrivano
+        # nel frattempo finiscono in un journal nuovo, riapplicato al caricamento
+        if os.path.exists(self.journal_path) and not os.path.exists(self.compacting_path):
+            os.replace(self.journal_path, self.compacting_path)
+        merged = dict(overlay)
+        if os.path.exists(self.csv_path):
+            merged.update(read_overlay(self.csv_path)[0])
+        merged.update(_read_journal(self.compacting_path))
+        df_out = export_frame(df_base, merged, last_key)
+        _write_csv_atomic(df_out, self.csv_path)
+        if os.path.exists(self.compacting_path):
+            os.remove(self.compacting_path)
+        self._records = None
+        return df_out
+
+
+class SqliteFeedbackStore:
+    """Feedback di un utente in un database SQLite condiviso (WAL), una connessione per sessione."""
+
+    def __init__(self, username, db_path="feedback.sqlite", directory="."):
+        self.username = username
+        self.db_path = db_path
+        self.csv_path = os.path.join(directory, f"feedback_{username}.csv")
+        # Streamlit può eseguire i rerun della stessa sessione su thread diversi
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        cols = ", ".join(FB_COLS)
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS feedback ("
+            f"username TEXT NOT NULL, notam_key TEXT NOT NULL, {cols}, updated_at REAL, "
+            f"PRIMARY KEY (username, notam_key)) WITHOUT ROWID"
+        )
+        self.conn.commit()
+
+    def _upsert(self, rows):
+        cols = ", ".join(FB_COLS)
+        placeholders = ", ".join("?" * (len(FB_COLS) + 3))
+        updates = ", ".join(f"{col}=excluded.{col}" for col in FB_COLS + ["updated_at"])
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO feedback (username, notam_key, {cols}, updated_at) VALUES ({placeholders}) "
+                f"ON CONFLICT (username, notam_key) DO UPDATE SET {updates}",
+                rows,
+            )
+
+    def save(self, key, fields):
+        """Scrittura puntuale (upsert) dei campi fb_* per la riga `key`."""
+        self.save_many({key: fields})
+
+    def save_many(self, feedback):
+        """Più righe {chiave: campi fb_*} in un'unica transazione."""
+        now = time.time()
+        self._upsert([
+            (self.username, key, *[fields.get(col, "") for col in FB_COLS], now)
+            for key, fields in feedback.items()
+        ])
+
+    def get(self, key):
+        """Lettura puntuale della riga `key` (None se non annotata)."""
+        cur = self.conn.execute(
+            f"SELECT {', '.join(FB_COLS)} FROM feedback WHERE username = ? AND notam_key = ?",
+            (self.username, key),
+        )
+        row = cur.fetchone()
+        return dict(zip(FB_COLS, row)) if row is not None else None
+
+    def replay(self):
+        cur = self.conn.execute(
+            f"SELECT notam_key, {', '.join(FB_COLS)} FROM feedback WHERE username = ?",
+            (self.username,),
+        )
+        return {row[0]: dict(zip(FB_COLS, row[1:])) for row in cur}
+
+    def compact(self, df_base, overlay, last_key=None):
+        """Il database è già aggiornato: scrive solo l'export CSV per il download.
+
+        L'export si costruisce dalle righe nel database (anche quelle salvate da altre
+        schede); `overlay` copre solo le chiavi non ancora scritte.
+        """
+        merged = dict(overlay)
+        merged.update(self.replay())
+        df_out = export_frame(df_base, merged, last_key)
+        _write_csv_atomic(df_out, self.csv_path)
+        return df_out
+
+
+def open_store(backend, username, db_path="feedback.sqlite"):
+    """Crea lo store dei feedback per il backend configurato ("journal" o "sqlite")."""
+    if backend == "sqlite":
+        return SqliteFeedbackStore(username, db_path=db_path)
+    if backend == "journal":
+        return JournalFeedbackStore(username)
+    raise ValueError(f"Unknown feedback backend: {backend}")
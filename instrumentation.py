@@ -0,0 +1,139 @@
+"""
+⏱️ Tempi di esecuzione dei rerun
+================================
+
+Misura quanto dura ogni fase di un rerun di `app.py` (auth, caricamento dataset,
+caricamento feedback utente, estrazione riga, render, salvataggio) e scrive una riga
+JSON per rerun nel file indicato in `PROFILE_LOG` (secrets). Gli ultimi rerun restano
+anche in memoria, condivisi tra le sessioni, per il pannello p50/p95 degli admin.
+
+Se `PROFILE_LOG` non è impostato si usa un timer nullo: `phase()` e `span()` non
+fanno nulla, quindi il costo sul percorso caldo è una chiamata di metodo vuota.
+"""
+
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import nullcontext
+
+import pandas as pd
+
+RECENT_RERUNS = 500
+
+_recent = deque(maxlen=RECENT_RERUNS)  # durate per fase degli ultimi rerun (tutte le sessioni)
+_recent_lock = threading.Lock()
+_NULL_SPAN = nullcontext()
+
+
+class _Span:
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer._add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class RerunTimer:
+    """Durate delle fasi di un singolo rerun."""
+
+    enabled = True
+
+    def __init__(self, log_path, session_id):
+        self.log_path = log_path
+        self.session_id = session_id
+        self.user = None
+        self.started_at = time.time()
+        self.spans = {}
+        self._phase = None
+        self._phase_start = None
+        self._finished = False
+
+    def _add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds * 1000
+
+    def phase(self, name):
+        """Chiude la fase corrente e ne apre una nuova (fasi sequenziali dello script)."""
+        now = time.perf_counter()
+        if self._phase is not None:
+            self._add(self._phase, now - self._phase_start)
+        self._phase, self._phase_start = name, now
+
+    def span(self, name):
+        """Context manager per un blocco annidato (es. il salvataggio)."""
+        return _Span(self, name)
+
+    def finish(self, stopped=False):
+        """Registra il rerun. Con `stopped` la fase aperta viene scartata (st.stop / st.rerun)."""
+        if self._finished:
+            return
+        self._finished = True
+        if self._phase is not None and not stopped:
+            self._add(self._phase, time.perf_counter() - self._phase_start)
+        self._phase = None
+
+        record = {
+            "ts": self.started_at,
+            "session": self.session_id,
+            "user": self.user,
+            "stopped": stopped,
+            "spans_ms": {name: round(ms, 3) for name, ms in self.spans.items()},
+        }
+        with _recent_lock:
+            _recent.append(record["spans_ms"])
+        with open(self.log_path, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(record) + "\n")
+
+
+class NullTimer:
+    """Timer disattivato: nessun costo oltre alla chiamata."""
+
+    enabled = False
+    user = None
+
+    def phase(self, name):
+        pass
+
+    def span(self, name):
+        return _NULL_SPAN
+
+    def finish(self, stopped=False):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def start_rerun(session_state, log_path):
+    """Timer per il rerun corrente; chiude quello precedente se si era interrotto."""
+    if not log_path:
+        return NULL_TIMER
+    previous = session_state.get("_rerun_timer")
+    if previous is not None:
+        previous.finish(stopped=True)
+    if "_profile_session" not in session_state:
+        session_state["_profile_session"] = uuid.uuid4().hex[:8]
+    timer = RerunTimer(log_path, session_state["_profile_session"])
+    session_state["_rerun_timer"] = timer
+    return timer
+
+
+def phase_percentiles():
+    """p50 / p95 (ms) per fase sugli ultimi rerun registrati."""
+    with _recent_lock:
+        recent = list(_recent)
+    if not recent:
+        return pd.DataFrame(columns=["p50_ms", "p95_ms", "count"])
+    spans = pd.DataFrame(recent)
+    stats = spans.quantile([0.5, 0.95]).T
+    stats.columns = ["p50_ms", "p95_ms"]
+    stats["count"] = spans.count()
+    return stats.round(2)
@@ -0,0 +1,79 @@
+"""
+🧬 Validazione e codifica del database NOTAM
+============================================
+
+Eseguita una sola volta al caricamento di ogni versione del database:
+
+- `tag_type` diventa un categorico con le categorie di `notam_general_relevance`,
+  `relevance_level` e `class_impact_*` categorici ordinati su `impact_levels`;
+- i valori non validi (categorie sconosciute, livelli scritti male, valori mancanti)
+  vengono raccolti tutti in un report invece di far fallire la pagina quando un pilota
+  arriva su quella riga; restano nel categorico come categorie extra (codice -1);
+- colore, rilevanza e descrizione della categoria, colore del badge e indice di ogni
+  livello di impatto vengono precalcolati per riga, così il render è una lettura di array.
+"""
+
+import numpy as np
+import pandas as pd
+
+from notam_tags_rel_levels import notam_general_relevance, impact_levels, category_colors, level_colors
+
+IMPACT_COLS = ["class_impact_med", "class_impact_tech", "class_impact_land"]
+LEVEL_COLS = ["relevance_level"] + IMPACT_COLS
+
+DEFAULT_CATEGORY_COLOR = "#7f8c8d"
+DEFAULT_LEVEL_COLOR = "#95a5a6"
+
+CATEGORY_DTYPE = pd.CategoricalDtype(list(notam_general_relevance))
+LEVEL_DTYPE = pd.CategoricalDtype(impact_levels, ordered=True)
+
+# colonne aggiunte da encode_dataset (da togliere negli export)
+ENCODED_COLS = [
+    "category_color", "category_relevance", "category_description", "relevance_color",
+    "tag_type_code",
+] + [f"{col}_code" for col in IMPACT_COLS]
+
+
+def _lookup(values, codes):
+    # codice -1 (valore non valido) → None, grazie all'elemento in coda
+    return np.append(np.asarray(values, dtype=object), None)[codes]
+
+
+def encode_dataset(df):
+    """Restituisce (df codificato, report dei valori non validi: notam_key, column, value)."""
+    df = df.copy()
+    issues = []
+
+    def encode(col, dtype):
+        raw = (df[col] if col in df.columns else pd.Series(np.nan, index=df.index)).astype("object")
+        valid = raw.isin(dtype.categories)
+        invalid = ~valid
+        # i valori non validi restano come categorie extra (codice -1), così l'export li conserva
+        extra = sorted(pd.unique(raw[invalid & raw.notna()]), key=str)
+        encoded = raw.astype(pd.CategoricalDtype(list(dtype.categories) + extra, ordered=dtype.ordered))
+        if invalid.any():
+            issues.append(pd.DataFrame({
+                "notam_key": df.loc[invalid, "notam_key"].to_numpy(),
+                "column": col,
+                "value": raw[invalid].astype("object").to_numpy(),
+            }))
+        df[col] = encoded
+        return np.where(valid, encoded.cat.codes, -1)
+
+    tag_codes = encode("tag_type", CATEGORY_DTYPE)
+    level_codes = {col: encode(col, LEVEL_DTYPE) for col in LEVEL_COLS}
+
+    infos = list(notam_general_relevance.values())
+    df["category_color"] = _lookup(
+        [category_colors.get(info["color"].lower(), DEFAULT_CATEGORY_COLOR) for info in infos], tag_codes)
+    df["category_relevance"] = _lookup([info["relevance"] for info in infos], tag_codes)
+    df["category_description"] = _lookup([info["description"] for info in infos], tag_codes)
+    relevance_codes = pd.Series(df["category_relevance"]).astype(LEVEL_DTYPE).cat.codes.to_numpy()
+    df["relevance_color"] = _lookup([level_colors[level] for level in impact_levels], relevance_codes)
+    df["tag_type_code"] = tag_codes
+    for col in IMPACT_COLS:
+        df[f"{col}_code"] = level_codes[col]
+
+    report = (pd.concat(issues, ignore_index=True) if issues
+              else pd.DataFrame(columns=["notam_key", "column", "value"]))
+    return df, report
@@ -0,0 +1,206 @@
+"""
+📦 Caricamento del database NOTAM
+=================================
+
+Il file `db.csv` viene letto una sola volta per versione e il DataFrame risultante è
+condiviso, in sola lettura, tra tutte le sessioni Streamlit dello stesso processo
+(i moduli importati sopravvivono ai rerun, quindi la cache vive a livello di modulo).
+
+La versione del file è riconosciuta da mtime + dimensione: finché non cambiano non si
+tocca il disco. Quando cambiano si ricalcola il checksum SHA-256 e il file viene
+riletto solo se il contenuto è davvero diverso.
+
+Durante il caricamento viene estratto, in un unico passaggio vettoriale, lo split
+`<Purpose>` / `<Topic>` / testo del NOTAM che prima veniva fatto riga per riga.
+
+Ogni NOTAM riceve inoltre una chiave stabile (`notam_key`, hash di e_line + tag_type)
+che non dipende dall'ordine delle righe: progressi e feedback sono legati alla chiave,
+non alla posizione, e sopravvivono a un nuovo export del database.
+
+Dopo il parsing i campi categoriali vengono validati e codificati (vedi `notam_encoding`):
+i valori non validi sono riportati in `NotamDataset.issues`.
+
+Oltre al CSV si può caricare la versione colonnare `.arrow` prodotta da `dataset_cache`
+(colonne derivate, chiavi e codifica già calcolate, categorici come dizionari Arrow): il
+file viene aperto in memory-map e versione e report dei valori non validi vengono letti
+dai metadati, senza rileggere né ricalcolare nulla.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+
+import pandas as pd
+
+from notam_encoding import ENCODED_COLS, encode_dataset
+
+logger = logging.getLogger(__name__)
+
+PURPOSE_PATTERN = r"<Purpose>(.*?)</Purpose>"
+TOPIC_PATTERN = r"<Topic>(.*?)</Topic>"
+TOPIC_END = "</Topic>"
+
+# colonne derivate da e_line
+TEXT_PART_COLS = ["purpose_text", "topic_text", "notam_text"]
+
+# colonne calcolate al caricamento (da togliere negli export)
+DERIVED_COLS = TEXT_PART_COLS + ENCODED_COLS
+
+ARROW_SUFFIX = ".arrow"
+SOURCE_HASH_KEY = b"source_sha256"
+ISSUES_KEY = b"encoding_issues"
+
+
+@dataclass(frozen=True)
+class NotamDataset:
+    """Database NOTAM caricato. `df` è condiviso tra le sessioni: non modificarlo."""
+    df: pd.DataFrame
+    version: str
+    path: str
+    key_index: pd.Index
+    issues: pd.DataFrame
+
+    def position(self, key):
+        """Posizione della riga con chiave `key` (None se non presente)."""
+        try:
+            return self.key_index.get_loc(key)
+        except KeyError:
+            return None
+
+
+_lock = threading.Lock()
+_cache = {}  # path -> (signature, NotamDataset); una sola versione per cartella della cache
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    """SHA-256 del file, letto a blocchi."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def split_e_line(e_line):
+    """Estrae Purpose, Topic e testo del NOTAM da una Series di e_line (vettoriale)."""
+    text = e_line.fillna("").astype(str)
+    purpose = text.str.extract(PURPOSE_PATTERN, expand=False).fillna("").str.strip()
+    topic = text.str.extract(TOPIC_PATTERN, expand=False).fillna("").str.strip()
+
+    # tutto ciò che segue il primo </Topic>; se manca, l'intero testo
+    parts = text.str.partition(TOPIC_END)
+    body = parts[2].where(parts[1] != "", parts[0]).str.strip()
+
+    return pd.DataFrame({
+        "purpose_text": purpose,
+        "topic_text": topic,
+        "notam_text": body,
+    }, index=e_line.index)
+
+
+def add_text_parts(df):
+    """Restituisce una copia di `df` con le colonne derivate da e_line."""
+    parts = split_e_line(df["e_line"])
+    return df.drop(columns=TEXT_PART_COLS, errors="ignore").join(parts)
+
+
+def notam_keys(df):
+    """Chiave stabile per NOTAM: hash di e_line + tag_type, indipendente dall'ordine delle righe."""
+    e_lines = df["e_line"].fillna("").astype(str)
+    tags = df["tag_type"].fillna("").astype(str)
+    return pd.Series(
+        [hashlib.sha1(f"{e_line}\x1f{tag}".encode("utf-8")).hexdigest()[:16]
+         for e_line, tag in zip(e_lines, tags)],
+        index=df.index, name="notam_key",
+    )
+
+
+def prepare_frame(df):
+    """Colonne derivate da e_line e chiavi stabili sul DataFrame grezzo del database."""
+    df = add_text_parts(df)
+    df["notam_key"] = notam_keys(df)
+    # righe identiche (stesso testo e categoria) sono lo stesso NOTAM
+    return df.drop_duplicates("notam_key").reset_index(drop=True)
+
+
+def prepare_dataset(df):
+    """Frame pronto per l'uso, dal DataFrame grezzo: (df codificato, report dei valori non validi)."""
+    return encode_dataset(prepare_frame(df))
+
+
+def issues_metadata(issues):
+    """Report dei valori non validi serializzato per i metadati del file .arrow."""
+    values = issues.astype(object).where(issues.notna(), None)
+    return json.dumps(values.to_dict("list"), ensure_ascii=False, default=str).encode("utf-8")
+
+
+def _read_arrow(path):
+    import pyarrow as pa
+
+    with pa.memory_map(path) as source:
+        table = pa.ipc.open_file(source).read_all()
+    df = table.to_pandas()
+    metadata = table.schema.metadata or {}
+    if ISSUES_KEY not in metadata:
+        # file convertito da una versione precedente, senza la codifica
+        return encode_dataset(df)
+    issues = pd.DataFrame(json.loads(metadata[ISSUES_KEY]), columns=["notam_key", "column", "value"])
+    return df, issues
+
+
+def _version(path):
+    if path.endswith(ARROW_SUFFIX):
+        # la versione è l'hash del CSV sorgente, salvato nei metadati alla conversione
+        import pyarrow as pa
+
+        with pa.memory_map(path) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+        if SOURCE_HASH_KEY in metadata:
+            return metadata[SOURCE_HASH_KEY].decode()
+    return file_checksum(path)
+
+
+def _parse(path, version):
+    if path.endswith(ARROW_SUFFIX):
+        # codifica e report già calcolati alla conversione (dataset_cache)
+        df, issues = _read_arrow(path)
+    else:
+        df, issues = prepare_dataset(pd.read_csv(path))
+    if not issues.empty:
+        logger.warning("%s: %d invalid values in %d NOTAMs", os.path.basename(path),
+                       len(issues), issues["notam_key"].nunique())
+    return NotamDataset(df=df, version=version, path=path,
+                        key_index=pd.Index(df["notam_key"]), issues=issues)
+
+
+def load_dataset(path):
+    """Restituisce il dataset condiviso, rileggendo il CSV solo se il file è cambiato."""
+    path = os.path.abspath(path)
+    with _lock:
+        signature = _file_signature(path)
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        version = _version(path)
+        if cached is not None and cached[1].version == version:
+            # file toccato ma contenuto identico: aggiorna solo la firma
+            dataset = cached[1]
+        else:
+            dataset = _parse(path, version)
+        _cache[path] = (signature, dataset)
+        if path.endswith(ARROW_SUFFIX):
+            # ogni versione della cache è un file nuovo: le precedenti non servono più
+            directory = os.path.dirname(path)
+            for other in [p for p in _cache if p != path and p.endswith(ARROW_SUFFIX)
+                          and os.path.dirname(p) == directory]:
+                del _cache[other]
+        return dataset
@@ -0,0 +1,182 @@
+"""
+🖼️ Cache dell'HTML delle schede NOTAM
+=====================================
+
+Il contesto, il testo del NOTAM, il box della categoria e i badge di impatto dipendono
+solo dai dati (immutabili) della riga: i frammenti HTML vengono costruiti una volta,
+con tutti i valori già passati da `html.escape`, e tenuti in una cache a livello di
+modulo con chiave (versione del dataset, notam_key), condivisa tra le sessioni.
+
+Mentre il pilota legge la riga corrente, un thread in background prepara le righe
+successive (e la precedente), così Next / Previous trovano l'HTML già pronto.
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
+
+from notam_encoding import DEFAULT_LEVEL_COLOR
+from notam_tags_rel_levels import level_colors
+
+PREFETCH_ROWS = 5
+MAX_CACHED_CARDS = 5_000
+
+_lock = threading.Lock()
+_cards = OrderedDict()  # (version, notam_key) -> dict di frammenti HTML (LRU)
+_pending = set()        # chiavi già in coda al prefetch
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="notam-render")
+
+IMPACT_BADGES = [
+    ("MEDICAL EMERGENCY", "class_impact_med", "💊"),
+    ("TECHNICAL ISSUE", "class_impact_tech", "⚙️"),
+    ("LAND ASAP", "class_impact_land", "🛬"),
+]
+
+
+def _text(value):
+    # valori mancanti (NaN / None) → stringa vuota, poi escape
+    return escape(value if isinstance(value, str) else "")
+
+
+def _badge(label, value, icon=""):
+    if not isinstance(value, str) or not value:
+        value = "N/A"
+    color = level_colors.get(value, DEFAULT_LEVEL_COLOR)
+    return (
+        "<div style='margin:2px 0; font-size:16px; display:flex; align-items:center;'>"
+        f"<span style='font-weight:bold; color:#000; margin-right:6px;'>{icon} {label}:</span>"
+        f"<span style='background-color:{color}; color:#fff; padding:4px 12px; "
+        f"border-radius:12px; font-weight:bold;'>{escape(value)}</span>"
+        "</div>"
+    )
+
+
+def build_cards(row):
+    """Frammenti HTML di una riga: context, notam, category_header, category_box, impact.
+
+    Con una categoria non valida (tag_type_code = -1) i tre frammenti della categoria
+    sono None e il box non viene mostrato.
+    """
+    cards = {
+        "context": f"""
+        <div style="background-color: #eef5ff; padding: 12px; border-radius: 8px;
+                    border: 1px solid #cce; font-size: 16px; font-weight: 500;
+                    line-height: 1.5; color: #000;">
+            <b>Purpose:</b> {_text(row["purpose_text"])}<br>
+            <b>Topic:</b> {_text(row["topic_text"])}
+        </div>
+        """,
+        "notam": f"""
+        <div style="background-color: #f9f9f9; padding: 18px 14px 22px 14px;
+                    border-radius: 10px; border: 1px solid #ddd;
+                    font-family: monospace; font-size: 18px;
+                    line-height: 1.7; white-space: pre-wrap; word-wrap: break-word;
+                    color: #000;">
+            {_text(row["notam_text"])}
+        </div>
+        """,
+        "category_header": None,
+        "category_box": None,
+        "impact": None,
+    }
+    if row["tag_type_code"] < 0:
+        return cards
+
+    category = _text(row["tag_type"])
+    color = row["category_color"]
+    badge_color = row["relevance_color"]
+    relevance = _text(row["category_relevance"])
+    desc = _text(row["category_description"])
+
+    cards["category_header"] = f"""
+        <div style='font-size:18px; margin-bottom:15px;'>
+            <b>Category:</b>
+            <span style='background-color:{color}; color:#fff; padding:4px 10px; border-radius:10px;'><b>{category}</b></span>
+            <span style='background-color:{badge_color}; color:#fff; padding:4px 10px; border-radius:10px; margin-left:8px;'><b>{relevance}</b></span>
+        </div>
+        """
+    cards["category_box"] = f"""
+        <div style="border: 1px solid #ccc; border-radius: 10px; overflow: hidden;">
+            <div style="background-color:{color}; color:#fff; padding:14px 18px;
+                        font-weight:bold; font-size:22px;">
+                {category}
+            </div>
+            <div style="padding:20px; font-size:18px; line-height:1.8; color:#000; background-color:#fafafa;">
+                <b style="font-size:19px;">Relevance:</b>
+                <span style="background-color:{badge_color}; color:#fff;
+                            padding:6px 14px; border-radius:14px;
+                            font-size:16px; font-weight:bold;">
+                    {relevance}
+                </span>
+                <br><br>
+                <b style="font-size:19px;">Description:</b><br>
+                <span style="font-size:17px;">{desc}</span>
+            </div>
+        </div>
+        """
+    impact_html = "".join(_badge(label, row[col], icon) for label, col, icon in IMPACT_BADGES)
+    cards["impact"] = f"""
+        <div style="margin:12px 0; padding:12px 8px 20px 8px;
+                    border:1px solid #ddd; border-radius:8px;
+                    background-color:#fdfdfd; font-size:16px;">
+            <b style="font-size:18px;">Impact Classes:</b>
+            {impact_html}
+        </div>
+        """
+    return cards
+
+
+def _store(cache_key, cards):
+    with _lock:
+        _cards[cache_key] = cards
+        _cards.move_to_end(cache_key)
+        while len(_cards) > MAX_CACHED_CARDS:
+            _cards.popitem(last=False)
+
+
+def get_cards(dataset, position):
+    """Frammenti HTML della riga `position` (dalla cache, o costruiti ora se mancano)."""
+    row = dataset.df.iloc[position]
+    cache_key = (dataset.version, row["notam_key"])
+    with _lock:
+        cards = _cards.get(cache_key)
+        if cards is not None:
+            _cards.move_to_end(cache_key)
+            return cards
+    cards = build_cards(row)
+    _store(cache_key, cards)
+    return cards
+
+
+def _warm(dataset, positions):
+    for position in positions:
+        row = dataset.df.iloc[position]
+        cache_key = (dataset.version, row["notam_key"])
+        try:
+            if cache_key not in _cards:
+                _store(cache_key, build_cards(row))
+        finally:
+            with _lock:
+                _pending.discard(cache_key)
+
+
+def prefetch(dataset, index, ahead=PREFETCH_ROWS, view=None):
+    """Prepara in background le `ahead` righe successive e la precedente (non blocca il rerun).
+
+    `index` è l'indice nella vista `view` (posizioni nel dataset; default tutto il dataset).
+    """
+    df = dataset.df
+    if view is None:
+        view = range(len(df))
+    candidates = [int(view[i]) for i in range(index - 1, index + ahead + 1)
+                  if i != index and 0 <= i < len(view)]
+    todo = []
+    with _lock:
+        for p in candidates:
+            cache_key = (dataset.version, df["notam_key"].iat[p])
+            if cache_key not in _cards and cache_key not in _pending:
+                _pending.add(cache_key)
+                todo.append(p)
+    if todo:
+        _executor.submit(_warm, dataset, todo)
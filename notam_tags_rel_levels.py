@@ -110,3 +110,20 @@ notam_general_relevance = {
         "description": "Includes NOTAMs starting with [US DOD PROCEDURAL NOTAM] as well as other specific information that only military crews should know.",
     },
 }
+
+# livelli ordinati usati da relevance_level e dalle classi di impatto (class_impact_*)
+impact_levels = ["Low", "Medium", "High", "Critical"]
+
+# colori (hex) dei nomi di colore usati in notam_general_relevance
+category_colors = {
+    "yellow": "#f1c40f", "red": "#e74c3c",
+    "green": "#2ecc71", "blue": "#3498db", "orange": "#e67e22"
+}
+
+# colori dei badge per livello di rilevanza / impatto
+level_colors = {
+    "Low": "#2ecc71",       # green
+    "Medium": "#f1c40f",    # yellow
+    "High": "#e67e22",      # orange
+    "Critical": "#e74c3c"   # red
+}
@@ -0,0 +1,174 @@
+"""
+🧭 Avanzamento dell'utente e code di lavoro per categoria
+=========================================================
+
+Per ogni versione del dataset le righe vengono divise una volta in code per categoria
+(`tag_type`, le righe con categoria non valida finiscono in "INVALID"), condivise tra
+le sessioni. Per ogni utente si tiene, accanto all'overlay dei feedback, una bitmap
+delle righe annotate e i contatori per categoria, aggiornati a ogni salvataggio.
+
+Così progresso, "rimanenti per categoria" e "prossimo NOTAM non annotato" (anche solo
+in alcune categorie o per rilevanza, es. solo Critical) non richiedono di scorrere il
+frame: per ogni coda un array "salta al prossimo libero" con path compression porta
+direttamente alla prima riga non annotata.
+
+Con lo scheduler (`workload_scheduler`) la bitmap copre solo la vista dell'utente, cioè
+le righe che gli sono assegnate; gli indici usati dall'app sono indici nella vista.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from notam_encoding import CATEGORY_DTYPE
+from notam_tags_rel_levels import notam_general_relevance
+
+INVALID_CATEGORY = "INVALID"
+# versioni del dataset tenute in memoria (durante un aggiornamento convivono la vecchia e la nuova)
+MAX_CACHED_VERSIONS = 2
+
+_lock = threading.Lock()
+_queues = OrderedDict()  # versione del dataset -> CategoryQueues (LRU)
+
+
+class CategoryQueues:
+    """Indici (nella vista) delle righe di ogni categoria, in ordine.
+
+    La vista è l'elenco ordinato delle posizioni servite all'utente: tutto il dataset,
+    oppure solo le righe assegnate dallo scheduler.
+    """
+
+    def __init__(self, df, view=None):
+        self.names = list(CATEGORY_DTYPE.categories) + [INVALID_CATEGORY]
+        codes = df["tag_type_code"].to_numpy().astype(np.int64)
+        if view is not None:
+            codes = codes[view]
+        codes[codes < 0] = len(self.names) - 1
+        self.codes = codes
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(self.names) + 1))
+        self.positions = [order[bounds[q]:bounds[q + 1]] for q in range(len(self.names))]
+        # indice di ogni riga all'interno della sua coda
+        self.rank = np.empty(len(codes), dtype=np.int64)
+        for queue in self.positions:
+            self.rank[queue] = np.arange(len(queue))
+        self.sizes = np.array([len(queue) for queue in self.positions], dtype=np.int64)
+
+
+def category_queues(dataset, view=None):
+    """Code per categoria; quelle dell'intero dataset sono condivise tra le sessioni."""
+    if view is not None:
+        return CategoryQueues(dataset.df, view)
+    with _lock:
+        queues = _queues.get(dataset.version)
+        if queues is None:
+            queues = _queues[dataset.version] = CategoryQueues(dataset.df)
+        _queues.move_to_end(dataset.version)
+        while len(_queues) > MAX_CACHED_VERSIONS:
+            _queues.popitem(last=False)
+        return queues
+
+
+def queue_names(categories=None, relevances=None):
+    """Code da considerare per i filtri scelti (None = tutte)."""
+    if not categories and not relevances:
+        return None
+    names = list(categories) if categories else list(notam_general_relevance) + [INVALID_CATEGORY]
+    if relevances:
+        names = [name for name in names
+                 if notam_general_relevance.get(name, {}).get("relevance") in relevances]
+    return names
+
+
+def _find(skip, i):
+    # primo indice libero >= i, con path compression
+    root = i
+    while skip[root] != root:
+        root = skip[root]
+    while skip[i] != root:
+        skip[i], i = root, skip[i]
+    return root
+
+
+class ProgressIndex:
+    """Bitmap delle righe annotate da un utente, con contatori e code per categoria.
+
+    Lavora sugli indici della vista (`view`, posizioni ordinate nel dataset; default
+    tutto il dataset): `position(i)` restituisce la riga del dataset.
+    """
+
+    def __init__(self, dataset, keys=(), view=None):
+        self.dataset = dataset
+        n_rows = len(dataset.df)
+        self.view = np.arange(n_rows) if view is None else np.sort(np.asarray(view, dtype=np.int64))
+        # posizione nel dataset -> indice nella vista (-1 = non assegnata)
+        self.view_of = np.full(n_rows, -1, dtype=np.int64)
+        self.view_of[self.view] = np.arange(len(self.view))
+        self.queues = category_queues(dataset, None if view is None else self.view)
+        self.done = np.zeros(len(self.view), dtype=bool)
+        self.done_counts = np.zeros(len(self.queues.names), dtype=np.int64)
+        self.total_done = 0
+        # skip[q][r] == r se la r-esima riga della coda q non è annotata; sentinella in coda
+        self._skip = [np.arange(size + 1, dtype=np.int64) for size in self.queues.sizes]
+        self.mark_keys(keys)
+
+    def __len__(self):
+        return len(self.view)
+
+    def position(self, i):
+        """Posizione nel dataset dell'i-esima riga della vista."""
+        return int(self.view[i])
+
+    def index_of(self, position):
+        """Indice nella vista della riga `position` del dataset (None se non assegnata)."""
+        if position is None or self.view_of[position] < 0:
+            return None
+        return int(self.view_of[position])
+
+    def mark(self, i):
+        """Segna come annotata l'i-esima riga della vista (O(1))."""
+        if self.done[i]:
+            return
+        self.done[i] = True
+        q = self.queues.codes[i]
+        r = self.queues.rank[i]
+        self._skip[q][r] = r + 1
+        self.done_counts[q] += 1
+        self.total_done += 1
+
+    def mark_keys(self, keys):
+        """Segna le righe con queste notam_key (chiavi non presenti nel dataset ignorate)."""
+        positions = self.dataset.key_index.get_indexer(pd.Index(list(keys)))
+        indices = self.view_of[positions[positions >= 0]]
+        for i in indices[indices >= 0]:
+            self.mark(i)
+
+    def is_done(self, i):
+        return bool(self.done[i])
+
+    def next_unannotated(self, start=0, names=None):
+        """Indice della prima riga non annotata da `start` in poi (poi dall'inizio), nelle code `names`."""
+        indices = range(len(self.queues.names)) if names is None else \
+            [self.queues.names.index(name) for name in names if name in self.queues.names]
+        for origin in (start, 0):
+            best = None
+            for q in indices:
+                queue = self.queues.positions[q]
+                r = _find(self._skip[q], int(np.searchsorted(queue, origin)))
+                if r < len(queue) and (best is None or queue[r] < best):
+                    best = int(queue[r])
+            if best is not None:
+                return best
+        return None
+
+    def remaining(self):
+        """Totale, annotati e rimanenti per categoria (solo categorie presenti nel dataset)."""
+        table = pd.DataFrame({
+            "category": self.queues.names,
+            "total": self.queues.sizes,
+            "done": self.done_counts,
+        })
+        table["remaining"] = table["total"] - table["done"]
+        return table[table["total"] > 0].set_index("category")
@@ -0,0 +1,207 @@
+"""
+🔎 Indice di ricerca full-text sui NOTAM e sulle note dei piloti
+================================================================
+
+Indice invertito SQLite FTS5 (`SEARCH_DB`, default `search.sqlite`) su:
+
+- testo del NOTAM, `<Purpose>` e `<Topic>` estratti da e_line, più `tag_type` per i
+  filtri strutturati: costruito una volta per versione del dataset;
+- `fb_notes` dei piloti, per (username, notam_key): aggiornato in modo incrementale a
+  ogni salvataggio (attraverso il writer in background, vedi `NotesWriter`) e dal
+  consolidamento (`consolidate_feedback.py --index`).
+
+La ricerca (es. `ILS RWY 27` o un indicativo ICAO) restituisce i NOTAM che contengono
+tutti i termini, senza scandire e_line con una regex. Uso da riga di comando:
+
+    python search_index.py "ILS RWY 27" --db db.csv
+    python search_index.py LIRF --notes --user mario
+"""
+
+import argparse
+import sqlite3
+import time
+
+import pandas as pd
+
+SNIPPET_TOKENS = 12
+
+
+def fts_query(text):
+    """Query FTS5 da testo libero: ogni parola è un termine tra virgolette, tutti obbligatori."""
+    terms = [term.replace('"', '""') for term in text.split()]
+    return " ".join(f'"{term}"' for term in terms)
+
+
+class SearchIndex:
+    """Indice FTS5 condiviso tra i processi (WAL).
+
+    Una connessione non va usata da più thread insieme (le transazioni sono manuali):
+    la sessione ne ha una per le ricerche, il writer in background una sua (`NotesWriter`).
+    """
+
+    def __init__(self, db_path="search.sqlite"):
+        self.db_path = db_path
+        # Streamlit può eseguire i rerun della stessa sessione su thread diversi
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False,
+                                    isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS notam_fts USING fts5("
+            "notam_key UNINDEXED, tag_type, purpose, topic, body, tokenize = 'unicode61')"
+        )
+        # note: tabella normale (aggiornabile per chiave) + indice FTS5 con contenuto esterno
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS notes ("
+            "username TEXT NOT NULL, notam_key TEXT NOT NULL, notes TEXT NOT NULL, updated_at REAL, "
+            "UNIQUE (username, notam_key))"
+        )
+        self.conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5("
+            "notes, content = 'notes', content_rowid = 'rowid', tokenize = 'unicode61')"
+        )
+        self.conn.executescript("""
+            CREATE TRIGGER IF NOT EXISTS notes_ai AFTER INSERT ON notes BEGIN
+                INSERT INTO notes_fts (rowid, notes) VALUES (new.rowid, new.notes);
+            END;
+            CREATE TRIGGER IF NOT EXISTS notes_ad AFTER DELETE ON notes BEGIN
+                INSERT INTO notes_fts (notes_fts, rowid, notes) VALUES ('delete', old.rowid, old.notes);
+            END;
+            CREATE TRIGGER IF NOT EXISTS notes_au AFTER UPDATE ON notes BEGIN
+                INSERT INTO notes_fts (notes_fts, rowid, notes) VALUES ('delete', old.rowid, old.notes);
+                INSERT INTO notes_fts (rowid, notes) VALUES (new.rowid, new.notes);
+            END;
+        """)
+
+    def indexed_version(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE name = 'dataset_version'").fetchone()
+        return row[0] if row else None
+
+    def ensure_dataset(self, dataset):
+        """Indicizza i NOTAM del dataset se l'indice è di un'altra versione. True se ricostruito."""
+        if self.indexed_version() == dataset.version:
+            return False
+        # BEGIN IMMEDIATE: un solo processo alla volta ricostruisce
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self.indexed_version() != dataset.version:
+                df = dataset.df
+                self.conn.execute("DELETE FROM notam_fts")
+                self.conn.executemany(
+                    "INSERT INTO notam_fts (notam_key, tag_type, purpose, topic, body) VALUES (?, ?, ?, ?, ?)",
+                    zip(df["notam_key"],
+                        df["tag_type"].astype(object).fillna("").astype(str),
+                        df["purpose_text"], df["topic_text"], df["notam_text"]),
+                )
+                self.conn.execute(
+                    "INSERT INTO meta VALUES ('dataset_version', ?) "
+                    "ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+                    (dataset.version,),
+                )
+                self.conn.execute("INSERT INTO notam_fts (notam_fts) VALUES ('optimize')")
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def update_notes(self, username, notes):
+        """Aggiorna le note di un utente: {notam_key: testo}; una nota vuota viene rimossa."""
+        now = time.time()
+        # IMMEDIATE: prende subito il lock di scrittura (in WAL un BEGIN differito che poi
+        # scrive può fallire con "database is locked" senza attendere il timeout)
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(
+                "DELETE FROM notes WHERE username = ? AND notam_key = ?",
+                ((username, key) for key, text in notes.items() if not text),
+            )
+            self.conn.executemany(
+                "INSERT INTO notes (username, notam_key, notes, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (username, notam_key) DO UPDATE SET notes = excluded.notes, "
+                "updated_at = excluded.updated_at",
+                ((username, key, text, now) for key, text in notes.items() if text),
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def search_notams(self, text, tag_type=None, limit=100):
+        """NOTAM che contengono tutti i termini (testo, Purpose, Topic), per rilevanza."""
+        query = fts_query(text)
+        if not query:
+            return pd.DataFrame(columns=["notam_key", "tag_type", "snippet"])
+        sql = (f"SELECT notam_key, tag_type, snippet(notam_fts, 4, '[', ']', '…', {SNIPPET_TOKENS}) AS snippet "
+               "FROM notam_fts WHERE notam_fts MATCH ?")
+        params = [query]
+        if tag_type:
+            sql += " AND tag_type = ?"
+            params.append(tag_type)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def search_notes(self, text, username=None, limit=100):
+        """Note dei piloti che contengono tutti i termini (solo di `username` se indicato)."""
+        query = fts_query(text)
+        if not query:
+            return pd.DataFrame(columns=["notam_key", "username", "snippet"])
+        sql = (f"SELECT n.notam_key, n.username, snippet(notes_fts, 0, '[', ']', '…', {SNIPPET_TOKENS}) AS snippet "
+               "FROM notes_fts JOIN notes n ON n.rowid = notes_fts.rowid WHERE notes_fts MATCH ?")
+        params = [query]
+        if username:
+            sql += " AND n.username = ?"
+            params.append(username)
+        sql += " ORDER BY notes_fts.rank LIMIT ?"
+        params.append(limit)
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+
+class NotesWriter:
+    """Adattatore per `write_behind`: le note salvate vanno nell'indice in background.
+
+    Ha una propria connessione, usata solo dal thread del writer: le transazioni
+    manuali (BEGIN / COMMIT) non si mescolano con quelle della sessione che cerca.
+    """
+
+    def __init__(self, db_path, username):
+        self.index = SearchIndex(db_path)
+        self.username = username
+
+    def save_many(self, feedback):
+        self.index.update_notes(self.username, {
+            key: str(fields.get("fb_notes") or "").strip() for key, fields in feedback.items()
+        })
+
+    def get(self, key):
+        return None
+
+
+def main(argv=None):
+    from notam_loader import load_dataset
+
+    parser = argparse.ArgumentParser(description="Full-text search over NOTAMs and pilot notes.")
+    parser.add_argument("query")
+    parser.add_argument("--index", default="search.sqlite", help="search index (SQLite FTS5)")
+    parser.add_argument("--db", help="NOTAM database (db.csv); (re)indexed if it is a new version")
+    parser.add_argument("--tag-type", help="only NOTAMs of this category")
+    parser.add_argument("--notes", action="store_true", help="search pilots' fb_notes instead of NOTAMs")
+    parser.add_argument("--user", help="with --notes, only this pilot's notes")
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    index = SearchIndex(args.index)
+    if args.db:
+        index.ensure_dataset(load_dataset(args.db))
+    if args.notes:
+        results = index.search_notes(args.query, username=args.user, limit=args.limit)
+    else:
+        results = index.search_notams(args.query, tag_type=args.tag_type, limit=args.limit)
+    with pd.option_context("display.max_colwidth", 120, "display.width", 200):
+        print(results.to_string(index=False) if not results.empty else "no matches")
+
+
+if __name__ == "__main__":
+    main()
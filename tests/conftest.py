@@ -0,0 +1,36 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from notam_loader import load_dataset  # noqa: E402
+from notam_tags_rel_levels import impact_levels, notam_general_relevance  # noqa: E402
+
+
+def make_db(n_rows, seed=0, invalid_every=17):
+    """db.csv piccolo: categorie di notam_general_relevance più qualche categoria non valida."""
+    rng = np.random.default_rng(seed)
+    categories = np.array(list(notam_general_relevance), dtype=object)
+    tag_type = categories[rng.integers(len(categories), size=n_rows)]
+    tag_type[::invalid_every] = "NOT A CATEGORY"
+    levels = np.array(impact_levels)
+    return pd.DataFrame({
+        "e_line": [f"<Purpose>Scenario {i}</Purpose><Topic>{tag}</Topic> A) LIRF E) RWY {i} CLSD"
+                   for i, tag in enumerate(tag_type)],
+        "tag_type": tag_type,
+        "relevance_level": levels[rng.integers(4, size=n_rows)],
+        "class_impact_med": levels[rng.integers(4, size=n_rows)],
+        "class_impact_tech": levels[rng.integers(4, size=n_rows)],
+        "class_impact_land": levels[rng.integers(4, size=n_rows)],
+    })
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = tmp_path / "db.csv"
+    make_db(300).to_csv(path, index=False)
+    return load_dataset(str(path))
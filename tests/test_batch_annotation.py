@@ -0,0 +1,29 @@
+import pandas as pd
+
+from batch_annotation import changed_feedback, page_frame
+from feedback_store import FB_COLS
+
+
+def test_changed_feedback_returns_only_edited_rows(dataset):
+    keys = list(dataset.df["notam_key"].iloc[:4])
+    overlay = {
+        keys[0]: {col: "" for col in FB_COLS} | {"fb_style": "2", "fb_notes": "ok"},
+        keys[1]: {col: "" for col in FB_COLS} | {"fb_notes": "to clear"},
+    }
+    original = page_frame(dataset.df, overlay, list(range(4)))
+    edited = original.copy()
+    edited.loc[1, "fb_notes"] = None          # riga svuotata: non si salva
+    edited.loc[2, "fb_realism"] = 4           # riga nuova
+    edited.loc[3, "fb_notes"] = ""            # NaN → "": nessuna modifica
+
+    assert changed_feedback(original, edited) == {
+        keys[2]: {col: "" for col in FB_COLS} | {"fb_realism": 4},
+    }
+    assert type(changed_feedback(original, edited)[keys[2]]["fb_realism"]) is int
+
+
+def test_changed_feedback_ignores_vote_types():
+    page = pd.DataFrame({"notam_key": ["a"]} | {col: [None] for col in FB_COLS})
+    original = page.assign(fb_style=pd.array([2], dtype="Int64"))
+    assert changed_feedback(original, page.assign(fb_style=[2.0])) == {}
+    assert changed_feedback(original, page.assign(fb_style=[3.0]))["a"]["fb_style"] == 3
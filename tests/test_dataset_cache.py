@@ -0,0 +1,53 @@
+import json
+import os
+
+import pytest
+
+from conftest import make_db
+from dataset_cache import CURRENT_FILE, ensure_dataset
+from notam_loader import file_checksum, load_dataset
+
+
+def write_source(path, n_rows, seed=0):
+    make_db(n_rows, seed=seed).to_csv(path, index=False)
+    return "file://" + str(path)
+
+
+def test_ensure_dataset_from_file_url(tmp_path):
+    url = write_source(tmp_path / "db.csv", 50)
+    cache_dir = str(tmp_path / "cache")
+    path = ensure_dataset(url, cache_dir)
+
+    assert path.endswith(".arrow") and os.path.exists(path)
+    dataset = load_dataset(path)
+    assert dataset.version == file_checksum(str(tmp_path / "db.csv"))
+    assert len(dataset.df) == 50 and not dataset.issues.empty
+    with open(os.path.join(cache_dir, CURRENT_FILE)) as fh:
+        assert json.load(fh)["arrow"] == os.path.basename(path)
+    assert [name for name in os.listdir(cache_dir) if name.endswith((".tmp", ".download"))] == []
+
+    # la sorgente cambia, ma entro refresh_seconds si usa la versione in cache
+    write_source(tmp_path / "db.csv", 60, seed=1)
+    assert ensure_dataset(url, cache_dir) == path
+
+
+def test_ensure_dataset_picks_up_a_new_version(tmp_path):
+    url = write_source(tmp_path / "db.csv", 50)
+    cache_dir = str(tmp_path / "cache")
+    old = ensure_dataset(url, cache_dir, refresh_seconds=0)
+    write_source(tmp_path / "db.csv", 60, seed=1)
+    new = ensure_dataset(url, cache_dir, refresh_seconds=0)
+    assert new != old
+    assert len(load_dataset(new).df) == 60
+
+
+def test_checksum_mismatch_keeps_the_cached_version(tmp_path):
+    url = write_source(tmp_path / "db.csv", 50)
+    cache_dir = str(tmp_path / "cache")
+    with pytest.raises(ValueError):
+        ensure_dataset(url, cache_dir, expected_sha256="0" * 64)
+    assert not os.path.exists(os.path.join(cache_dir, CURRENT_FILE))
+
+    path = ensure_dataset(url, cache_dir, refresh_seconds=0)
+    write_source(tmp_path / "db.csv", 60, seed=1)
+    assert ensure_dataset(url, cache_dir, expected_sha256="0" * 64, refresh_seconds=0) == path
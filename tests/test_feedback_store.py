@@ -0,0 +1,122 @@
+import os
+import threading
+
+import pandas as pd
+
+from feedback_store import FB_COLS, JournalFeedbackStore, SqliteFeedbackStore, read_overlay
+
+
+def fields(note):
+    return {col: (note if col == "fb_notes" else "") for col in FB_COLS}
+
+
+def notes(df):
+    annotated = df[df["fb_notes"] != ""]
+    return dict(zip(annotated["notam_key"], annotated["fb_notes"]))
+
+
+def test_journal_replay_last_record_wins(tmp_path):
+    store = JournalFeedbackStore("mario", directory=tmp_path)
+    store.save("a", fields("1"))
+    store.save_many({"a": fields("2"), "b": fields("3")})
+    # riga troncata da un crash
+    with open(store.journal_path, "a", encoding="utf-8") as fh:
+        fh.write('{"key": "c", "fb_no')
+    assert store.replay() == {"a": fields("2"), "b": fields("3")}
+    assert store.get("a") == fields("2")
+
+
+def test_journal_compact_merges_csv_and_other_tabs(tmp_path, dataset):
+    keys = list(dataset.df["notam_key"])
+    tab1 = JournalFeedbackStore("mario", directory=tmp_path)
+    tab2 = JournalFeedbackStore("mario", directory=tmp_path)
+
+    tab1.save(keys[0], fields("first"))
+    tab1.compact(dataset.df, {keys[0]: fields("first")}, keys[0])
+
+    tab1.save(keys[1], fields("tab1"))
+    tab2.save(keys[2], fields("tab2"))
+    tab2.save(keys[0], fields("updated"))
+    # la sessione di tab1 ha ancora il valore vecchio di keys[0]
+    df_out = tab1.compact(dataset.df, {keys[0]: fields("first"), keys[1]: fields("tab1")}, keys[1])
+
+    expected = {keys[0]: "updated", keys[1]: "tab1", keys[2]: "tab2"}
+    assert notes(df_out) == expected
+    overlay, progress = read_overlay(tab1.csv_path)
+    assert {key: value["fb_notes"] for key, value in overlay.items()} == expected
+    assert progress["last_key"] == keys[1]
+    assert not os.path.exists(tab1.journal_path)
+    assert not os.path.exists(tab1.compacting_path)
+    assert tab1.replay() == {}
+
+
+def test_interrupted_compaction_is_replayed(tmp_path):
+    store = JournalFeedbackStore("mario", directory=tmp_path)
+    store.save("a", fields("old"))
+    os.replace(store.journal_path, store.compacting_path)
+    store.save("a", fields("new"))
+    store.save("b", fields("b"))
+    assert store.replay() == {"a": fields("new"), "b": fields("b")}
+
+
+def test_journal_upload_is_compacted(tmp_path, dataset):
+    key = dataset.df["notam_key"].iloc[5]
+    store = JournalFeedbackStore("mario", directory=tmp_path)
+    # il file caricato passa dal writer come un salvataggio qualsiasi
+    store.save_many({key: fields("uploaded")})
+    df_out = store.compact(dataset.df, {}, key)
+    assert notes(df_out) == {key: "uploaded"}
+
+
+def test_sqlite_compact_includes_other_connections(tmp_path, dataset):
+    keys = list(dataset.df["notam_key"])
+    db_path = str(tmp_path / "feedback.sqlite")
+    tab1 = SqliteFeedbackStore("mario", db_path=db_path, directory=tmp_path)
+    tab2 = SqliteFeedbackStore("mario", db_path=db_path, directory=tmp_path)
+    other_user = SqliteFeedbackStore("luigi", db_path=db_path, directory=tmp_path)
+    tab1.save(keys[0], fields("tab1"))
+    tab2.save(keys[1], fields("tab2"))
+    other_user.save(keys[2], fields("luigi"))
+    df_out = tab1.compact(dataset.df, {keys[0]: fields("tab1")}, keys[0])
+    assert notes(df_out) == {keys[0]: "tab1", keys[1]: "tab2"}
+    assert "purpose_text" not in df_out.columns
+    assert (df_out["last_key"] == keys[0]).all()
+
+
+def test_read_overlay_keeps_votes_as_integers(tmp_path):
+    path = tmp_path / "feedback.csv"
+    pd.DataFrame({
+        "notam_key": ["a", "b"],
+        "fb_style": [2, None],
+        "fb_realism": [None, 4],
+        "fb_notes": ["ok", ""],
+    }).to_csv(path, index=False)
+    overlay, _ = read_overlay(path)
+    assert overlay["a"]["fb_style"] == 2 and type(overlay["a"]["fb_style"]) is int
+    assert overlay["a"]["fb_realism"] == ""
+    assert overlay["b"]["fb_realism"] == 4 and type(overlay["b"]["fb_realism"]) is int
+
+
+def test_concurrent_exports_of_the_same_user(tmp_path, dataset):
+    db_path = str(tmp_path / "feedback.sqlite")
+    key = dataset.df["notam_key"].iloc[0]
+    tabs = [SqliteFeedbackStore("mario", db_path=db_path, directory=tmp_path) for _ in range(4)]
+    tabs[0].save(key, fields("x"))
+    errors = []
+
+    def export(store):
+        try:
+            for _ in range(5):
+                store.compact(dataset.df, {}, key)
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=export, args=(tab,)) for tab in tabs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    overlay, _ = read_overlay(tabs[0].csv_path)
+    assert overlay[key]["fb_notes"] == "x"
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+from notam_encoding import encode_dataset
+from notam_tags_rel_levels import impact_levels, notam_general_relevance
+
+
+def test_encode_dataset_reports_invalid_values():
+    category = next(iter(notam_general_relevance))
+    df = pd.DataFrame({
+        "notam_key": ["a", "b", "c"],
+        "tag_type": [category, "NOT A CATEGORY", category],
+        "relevance_level": [impact_levels[0], impact_levels[1], None],
+        "class_impact_med": [impact_levels[2], "very hihg", impact_levels[0]],
+        "class_impact_tech": impact_levels[:3],
+        "class_impact_land": impact_levels[:3],
+    })
+    encoded, issues = encode_dataset(df)
+
+    assert "category_color" not in df.columns  # il frame di partenza non viene modificato
+    report = issues.fillna("<missing>")
+    assert sorted(map(tuple, report.to_numpy())) == [
+        ("b", "class_impact_med", "very hihg"),
+        ("b", "tag_type", "NOT A CATEGORY"),
+        ("c", "relevance_level", "<missing>"),
+    ]
+    # i valori non validi restano nel categorico, con codice -1
+    assert list(encoded["tag_type"].astype(object)) == list(df["tag_type"])
+    assert list(encoded["tag_type_code"]) == [0, -1, 0]
+    assert list(encoded["class_impact_med_code"]) == [2, -1, 0]
+    assert encoded["class_impact_med"].cat.ordered
+
+    info = notam_general_relevance[category]
+    assert encoded["category_relevance"].iloc[0] == info["relevance"]
+    assert encoded["category_description"].iloc[0] == info["description"]
+    assert pd.isna(encoded["category_color"].iloc[1])
+    assert pd.isna(encoded["relevance_color"].iloc[1])
+
+
+def test_encode_dataset_without_issues():
+    category = next(iter(notam_general_relevance))
+    df = pd.DataFrame({"notam_key": ["a"], "tag_type": [category]})
+    df[["relevance_level", "class_impact_med", "class_impact_tech", "class_impact_land"]] = impact_levels[0]
+    encoded, issues = encode_dataset(df)
+    assert issues.empty and list(issues.columns) == ["notam_key", "column", "value"]
+    assert np.all(encoded[[c for c in encoded.columns if c.endswith("_code")]].to_numpy() == 0)
@@ -0,0 +1,35 @@
+import pandas as pd
+
+from notam_loader import notam_keys, split_e_line
+
+
+def test_split_e_line():
+    e_line = pd.Series([
+        "<Purpose> Check </Purpose><Topic>AERODROME</Topic> A) LIRF E) RWY 16L CLSD",
+        "A) LIRF E) TWY B CLSD",
+        None,
+        "<Topic>X</Topic>first</Topic>second",
+    ], index=[10, 11, 12, 13])
+    parts = split_e_line(e_line)
+    assert list(parts.index) == [10, 11, 12, 13]
+    assert parts.loc[10].to_dict() == {
+        "purpose_text": "Check", "topic_text": "AERODROME", "notam_text": "A) LIRF E) RWY 16L CLSD"}
+    # senza tag: tutto il testo è il NOTAM
+    assert parts.loc[11].to_dict() == {"purpose_text": "", "topic_text": "", "notam_text": "A) LIRF E) TWY B CLSD"}
+    assert parts.loc[12].to_dict() == {"purpose_text": "", "topic_text": "", "notam_text": ""}
+    # il testo parte dal primo </Topic>
+    assert parts.loc[13, "notam_text"] == "first</Topic>second"
+
+
+def test_notam_keys_do_not_depend_on_row_order():
+    df = pd.DataFrame({
+        "e_line": ["RWY 16L CLSD", "RWY 16L CLSD", "TWY B CLSD", None],
+        "tag_type": ["AERODROME", "MILITARY", "AERODROME", "AERODROME"],
+    })
+    keys = notam_keys(df)
+    assert keys.name == "notam_key"
+    assert keys.nunique() == 4  # stesso e_line, tag_type diverso → chiavi diverse
+    assert (keys.str.len() == 16).all()
+
+    shuffled = df.iloc[[3, 1, 0, 2]].reset_index(drop=True)
+    assert list(notam_keys(shuffled)) == list(keys.iloc[[3, 1, 0, 2]])
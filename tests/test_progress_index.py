@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from progress_index import INVALID_CATEGORY, ProgressIndex, queue_names
+
+
+def brute_next(index, start, names):
+    # prima riga non annotata da `start` in poi, poi dall'inizio, scandendo tutta la vista
+    allowed = set(range(len(index.queues.names))) if names is None else \
+        {index.queues.names.index(name) for name in names if name in index.queues.names}
+    for origin in (start, 0):
+        for i in range(origin, len(index)):
+            if not index.done[i] and index.queues.codes[i] in allowed:
+                return i
+    return None
+
+
+def name_filters(index):
+    present = [name for name, size in zip(index.queues.names, index.queues.sizes) if size]
+    return [None, present[:1], present[1:4], [INVALID_CATEGORY], ["UNKNOWN"],
+            queue_names(relevances=["Critical"]), queue_names(relevances=["Low", "Medium"])]
+
+
+@pytest.mark.parametrize("with_view", [False, True])
+def test_next_unannotated_matches_brute_force(dataset, with_view):
+    rng = np.random.default_rng(1)
+    view = np.sort(rng.choice(len(dataset.df), size=120, replace=False)) if with_view else None
+    index = ProgressIndex(dataset, view=view)
+    order = rng.permutation(len(index))
+    # segna le righe a blocchi, controllando dopo ogni blocco (path compression inclusa)
+    for chunk in np.array_split(order, 12):
+        for i in chunk:
+            index.mark(int(i))
+        for names in name_filters(index):
+            for start in [0, len(index) - 1, *rng.integers(len(index), size=8)]:
+                assert index.next_unannotated(int(start), names) == brute_next(index, int(start), names)
+    assert index.next_unannotated(0) is None
+
+
+def test_counts_follow_marks(dataset):
+    keys = list(dataset.df["notam_key"].iloc[:40])
+    index = ProgressIndex(dataset, keys + ["not-a-key"])
+    assert index.total_done == 40 == index.done.sum()
+    index.mark(0)  # già annotata
+    assert index.total_done == 40
+    table = index.remaining()
+    assert table["total"].sum() == len(dataset.df)
+    assert table["done"].sum() == 40
+    assert (table["remaining"] == table["total"] - table["done"]).all()
+    assert table.loc[INVALID_CATEGORY, "total"] == (dataset.df["tag_type_code"] < 0).sum()
+
+
+def test_view_maps_to_dataset_positions(dataset):
+    view = [250, 3, 99, 4]
+    index = ProgressIndex(dataset, [dataset.df["notam_key"].iloc[99]], view=view)
+    assert len(index) == 4
+    assert [index.position(i) for i in range(4)] == [3, 4, 99, 250]
+    assert index.index_of(99) == 2 and index.index_of(5) is None
+    assert index.is_done(2) and index.total_done == 1
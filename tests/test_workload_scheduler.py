@@ -0,0 +1,149 @@
+import time
+
+import pandas as pd
+import pytest
+
+from conftest import make_db
+from notam_loader import load_dataset
+from workload_scheduler import DoneWriter, WorkloadScheduler, plan_assignments
+
+PILOTS = ["p1", "p2", "p3", "p4", "p5"]
+
+
+def assignments(scheduler):
+    return pd.read_sql_query(
+        "SELECT username, notam_key, done FROM assignment WHERE dataset_version = ?",
+        scheduler.conn, params=(scheduler.version,),
+    )
+
+
+def check_redundancy(scheduler, redundancy):
+    table = assignments(scheduler)
+    holders = table.groupby("notam_key")["username"].nunique()
+    assert len(holders) == len(scheduler.dataset.df)
+    assert (holders == redundancy).all()
+    assert not table.duplicated(["notam_key", "username"]).any()
+
+
+@pytest.mark.parametrize("redundancy", [1, 2, 3])
+def test_plan_gives_each_notam_distinct_pilots(dataset, redundancy):
+    plan = plan_assignments(dataset.df, PILOTS, redundancy)
+    assert len(plan) == len(dataset.df) * redundancy
+    assert (plan.groupby("notam_key")["username"].nunique() == redundancy).all()
+    assert set(plan["notam_key"]) == set(dataset.df["notam_key"])
+
+
+def test_plan_is_balanced_within_each_category(dataset):
+    plan = plan_assignments(dataset.df, PILOTS, 3)
+    category = dict(zip(dataset.df["notam_key"], dataset.df["tag_type"].astype(str)))
+    counts = (plan.assign(category=plan["notam_key"].map(category))
+              .groupby(["category", "username"]).size()
+              .unstack(fill_value=0).reindex(columns=PILOTS, fill_value=0))
+    assert ((counts.max(axis=1) - counts.min(axis=1)) <= 1).all()
+
+
+def test_plan_redundancy_is_capped_by_pilots(dataset):
+    plan = plan_assignments(dataset.df, ["p1", "p2"], 3)
+    assert (plan.groupby("notam_key")["username"].nunique() == 2).all()
+    assert plan_assignments(dataset.df, [], 3).empty
+
+
+def test_rebalance_moves_open_work_of_absent_pilots(dataset, tmp_path):
+    scheduler = WorkloadScheduler(str(tmp_path / "a.sqlite"), dataset, PILOTS, redundancy=3)
+    scheduler.ensure_plan()
+    for pilot in PILOTS:
+        scheduler.checkin(pilot)
+    done_p2 = scheduler.queue("p2")[:10]
+    scheduler.mark_done("p2", done_p2)
+    scheduler.mark_done("p1", scheduler.queue("p1")[:20])
+    open_p2 = len(scheduler.queue("p2")) - len(done_p2)
+    done_before = assignments(scheduler).query("done == 1")
+    scheduler.conn.execute("UPDATE pilot SET last_seen = ? WHERE username = 'p2'",
+                           (time.time() - 30 * 86400,))
+
+    moved = scheduler.rebalance()
+
+    table = assignments(scheduler)
+    assert moved == open_p2
+    assert set(table.query("username == 'p2' and done == 0")["notam_key"]) == set()
+    assert set(table.query("username == 'p2'")["notam_key"]) == set(done_p2)
+    # le righe già annotate non si spostano
+    pd.testing.assert_frame_equal(
+        table.query("done == 1").sort_values(["username", "notam_key"]).reset_index(drop=True),
+        done_before.sort_values(["username", "notam_key"]).reset_index(drop=True),
+    )
+    check_redundancy(scheduler, 3)
+    assert scheduler.queue_revision("p2") == 1
+    assert sum(scheduler.queue_revision(p) for p in PILOTS) >= 2
+
+
+def test_new_pilot_takes_work_from_the_most_loaded(dataset, tmp_path):
+    db_path = str(tmp_path / "a.sqlite")
+    WorkloadScheduler(db_path, dataset, PILOTS[:4], redundancy=2).ensure_plan()
+    scheduler = WorkloadScheduler(db_path, dataset, PILOTS, redundancy=2)
+    assert scheduler.queue_revision("p5") == 0
+
+    assert scheduler.rebalance() > 0
+
+    check_redundancy(scheduler, 2)
+    load = assignments(scheduler).query("done == 0")["username"].value_counts()
+    average = len(dataset.df) * 2 / len(PILOTS)
+    assert load["p5"] > 0 and load["p5"] <= average + 1
+    assert scheduler.queue_revision("p5") == 1
+
+
+def test_balanced_plan_is_not_rebalanced(dataset, tmp_path):
+    scheduler = WorkloadScheduler(str(tmp_path / "a.sqlite"), dataset, PILOTS, redundancy=3)
+    scheduler.ensure_plan()
+    before = assignments(scheduler)
+    assert scheduler.rebalance() == 0
+    pd.testing.assert_frame_equal(assignments(scheduler), before)
+    assert all(scheduler.queue_revision(p) == 0 for p in PILOTS)
+
+
+def test_pilot_who_never_logs_in_is_dropped(dataset, tmp_path):
+    scheduler = WorkloadScheduler(str(tmp_path / "a.sqlite"), dataset, PILOTS, redundancy=2,
+                                  drop_after_days=7)
+    scheduler.ensure_plan()
+    for pilot in PILOTS[1:]:
+        scheduler.checkin(pilot)
+    assert scheduler.rebalance() == 0  # piano appena creato: p1 non è ancora assente
+    scheduler.conn.execute("UPDATE assignment SET assigned_at = assigned_at - ?", (30 * 86400,))
+    assert scheduler.rebalance() > 0
+    assert scheduler.queue("p1") == []
+    check_redundancy(scheduler, 2)
+
+
+def test_new_dataset_version_keeps_assignments(dataset, tmp_path):
+    db_path = str(tmp_path / "a.sqlite")
+    old = WorkloadScheduler(db_path, dataset, PILOTS, redundancy=2)
+    old.ensure_plan()
+    old.mark_done("p3", old.queue("p3")[:15])
+    before = assignments(old).set_index(["username", "notam_key"])
+
+    # nuovo export: 20 NOTAM tolti, 30 aggiunti, righe in un altro ordine
+    raw = make_db(330)
+    export = pd.concat([raw.iloc[20:300].sample(frac=1, random_state=0), raw.iloc[300:]])
+    path = tmp_path / "db2.csv"
+    export.to_csv(path, index=False)
+    new_dataset = load_dataset(str(path))
+    new = WorkloadScheduler(db_path, new_dataset, PILOTS, redundancy=2)
+    assert new.ensure_plan()
+    assert not new.ensure_plan()
+
+    after = assignments(new).set_index(["username", "notam_key"])
+    kept = before[before.index.get_level_values("notam_key").isin(new_dataset.key_index)]
+    pd.testing.assert_frame_equal(after.loc[kept.index], kept)
+    assert set(after.index.get_level_values("notam_key")) == set(new_dataset.df["notam_key"])
+    check_redundancy(new, 2)
+
+
+def test_done_writer_marks_saved_rows(dataset, tmp_path):
+    scheduler = WorkloadScheduler(str(tmp_path / "a.sqlite"), dataset, PILOTS, redundancy=2)
+    scheduler.ensure_plan()
+    keys = scheduler.queue("p2")[:3]
+    writer = DoneWriter(scheduler, "p2")
+    writer.save_many({key: {} for key in keys + ["not-assigned"]})
+    done = assignments(scheduler).query("username == 'p2' and done == 1")
+    assert sorted(done["notam_key"]) == sorted(keys)
+    assert writer.get(keys[0]) is None
@@ -0,0 +1,145 @@
+import threading
+import time
+
+import pytest
+
+from write_behind import SyncSaver, WriteBehindSaver
+
+
+class MemoryStore:
+    def __init__(self, fail=False):
+        self.rows = {}
+        self.calls = []
+        self.fail = fail
+        self.lock = threading.Lock()
+
+    def save_many(self, feedback):
+        with self.lock:
+            self.calls.append(dict(feedback))
+            if self.fail:
+                raise OSError("disk full")
+            self.rows.update(feedback)
+
+    def get(self, key):
+        return self.rows.get(key)
+
+
+def test_submit_is_buffered_until_flush():
+    saver = WriteBehindSaver(interval=60)
+    store = MemoryStore()
+    saver.submit(store, {"a": {"fb_notes": "x"}})
+    assert store.calls == []
+    assert saver.get(store, "a") == {"fb_notes": "x"}
+    assert saver.status(store)["pending"] == 1
+
+    assert saver.flush(5, store=store)
+    assert store.rows == {"a": {"fb_notes": "x"}}
+    status = saver.status(store)
+    assert status["pending"] == 0 and status["error"] is None and status["last_flush"]
+
+
+def test_saves_of_the_same_row_are_coalesced():
+    saver = WriteBehindSaver(interval=60)
+    store = MemoryStore()
+    saver.submit(store, {"a": {"fb_notes": "1"}})
+    saver.submit(store, {"a": {"fb_notes": "2"}, "b": {"fb_notes": "3"}})
+    assert saver.flush(5)
+    assert store.calls == [{"a": {"fb_notes": "2"}, "b": {"fb_notes": "3"}}]
+
+
+def test_background_thread_writes_without_flush():
+    saver = WriteBehindSaver(interval=0.05)
+    store = MemoryStore()
+    saver.submit(store, {"a": {"fb_notes": "x"}})
+    deadline = time.monotonic() + 5
+    while not store.rows and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert store.rows == {"a": {"fb_notes": "x"}}
+
+
+def test_failed_write_is_kept_and_reported():
+    saver = WriteBehindSaver(interval=60)
+    store = MemoryStore(fail=True)
+    saver.submit(store, {"a": {"fb_notes": "old"}})
+    assert not saver.flush(5, store=store)
+    assert saver.status(store)["error"] == "disk full"
+    assert saver.status(store)["pending"] == 1
+
+    # un salvataggio più recente della stessa riga non viene sovrascritto dal retry
+    saver.submit(store, {"a": {"fb_notes": "new"}})
+    store.fail = False
+    assert saver.flush(5, store=store)
+    assert store.rows == {"a": {"fb_notes": "new"}}
+    assert saver.status(store)["error"] is None
+
+
+def test_failing_store_does_not_fail_other_stores():
+    saver = WriteBehindSaver(interval=60)
+    bad, good = MemoryStore(fail=True), MemoryStore()
+    saver.submit(bad, {"a": {}})
+    saver.submit(good, {"b": {}})
+    assert saver.flush(5, store=good)
+    assert not saver.flush(5)
+    assert good.rows == {"b": {}}
+
+
+def test_retries_back_off():
+    saver = WriteBehindSaver(interval=0.05)
+    store = MemoryStore(fail=True)
+    saver.submit(store, {"a": {}})
+    time.sleep(1)
+    # attese 0.1, 0.2, 0.4, 0.8 s: pochi tentativi, non un ciclo continuo
+    assert 1 <= len(store.calls) <= 5
+
+
+def test_submit_times_out_when_the_buffer_stays_full():
+    saver = WriteBehindSaver(interval=60, max_pending=2, submit_timeout=0.2)
+    store = MemoryStore(fail=True)
+    saver.submit(store, {"a": {}, "b": {}})
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        saver.submit(store, {"c": {}})
+    assert time.monotonic() - start < 5
+
+
+def test_full_buffer_waits_for_the_write():
+    saver = WriteBehindSaver(interval=60, max_pending=2, submit_timeout=5)
+    store = MemoryStore()
+    saver.submit(store, {"a": {}, "b": {}})
+    saver.submit(store, {"c": {}})
+    assert saver.flush(5)
+    assert set(store.rows) == {"a", "b", "c"}
+
+
+def test_sync_saver_writes_immediately():
+    saver = SyncSaver()
+    store = MemoryStore()
+    saver.submit(store, {"a": {"fb_notes": "x"}})
+    assert store.rows == {"a": {"fb_notes": "x"}}
+    assert saver.flush() and saver.status(store)["pending"] == 0
+
+
+def test_flush_of_one_store_does_not_wait_for_the_others():
+    saver = WriteBehindSaver(interval=60)
+    slow, mine = MemoryStore(), MemoryStore()
+    slow.save_many = lambda feedback: time.sleep(2)
+    saver.submit(slow, {"a": {}})
+    saver.submit(mine, {"b": {}})
+    start = time.monotonic()
+    assert saver.flush(5, store=mine)
+    assert time.monotonic() - start < 1
+    assert mine.rows == {"b": {}}
+
+
+def test_flush_by_username_covers_previous_sessions():
+    saver = WriteBehindSaver(interval=60)
+    old_session, other_user = MemoryStore(), MemoryStore()
+    old_session.username, other_user.username = "mario", "luigi"
+    other_user.save_many = lambda feedback: time.sleep(2)
+    saver.submit(other_user, {"a": {}})
+    saver.submit(old_session, {"b": {}})
+    start = time.monotonic()
+    assert saver.flush(5, username="mario")
+    assert time.monotonic() - start < 1
+    assert old_session.rows == {"b": {}}
+    assert saver.flush(5, username="nobody")
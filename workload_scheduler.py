@@ -0,0 +1,308 @@
+"""
+🗓️ Assegnazione dei NOTAM ai piloti
+===================================
+
+Invece di dare a ogni pilota l'intero dataset, i NOTAM vengono divisi tra gli username
+registrati (`PILOTS` nei secrets) in modo che ogni NOTAM sia annotato da
+`ASSIGNMENT_REDUNDANCY` piloti (default 3).
+
+- Il piano viene creato una volta per versione del dataset ed è stratificato per
+  `tag_type`: dentro ogni categoria i NOTAM sono distribuiti a rotazione su tutti i
+  piloti, così anche le categorie rare finiscono a più persone. Con una nuova versione
+  le assegnazioni (e i flag `done`) della precedente passano ai NOTAM con la stessa
+  `notam_key`: si pianificano solo i NOTAM nuovi.
+- Le assegnazioni sono in un database SQLite condiviso (`ASSIGNMENT_DB`, WAL), con un
+  flag `done` aggiornato a ogni salvataggio.
+- Ribilanciamento: i NOTAM non ancora annotati da un pilota che non si vede da
+  `ASSIGNMENT_DROP_DAYS` giorni (o che non è mai entrato da quando ha ricevuto il
+  lavoro) passano ai piloti attivi con meno lavoro aperto; chi ha
+  finito la propria coda (o è stato aggiunto dopo) prende NOTAM aperti dai piloti più
+  carichi. La ridondanza per NOTAM resta invariata (un NOTAM non va mai due volte
+  allo stesso pilota).
+- Ogni ribilanciamento incrementa la revisione della coda dei piloti coinvolti
+  (`queue_revision`): la sessione di un pilota attivo la confronta a ogni rerun e
+  ricostruisce la propria vista se la coda è cambiata.
+"""
+
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_REDUNDANCY = 3
+DEFAULT_DROP_DAYS = 7
+
+
+def plan_assignments(df, pilots, redundancy=DEFAULT_REDUNDANCY):
+    """Piano iniziale: DataFrame (notam_key, username), stratificato per tag_type.
+
+    I NOTAM di ogni categoria (in ordine di chiave, cioè pseudo-casuale) prendono a turno
+    i `redundancy` piloti successivi di un ciclo unico, che prosegue da una categoria
+    all'altra: il carico per pilota differisce al più di uno per categoria.
+    """
+    pilots = sorted(set(pilots))
+    redundancy = min(redundancy, len(pilots))
+    if not pilots or redundancy <= 0:
+        return pd.DataFrame(columns=["notam_key", "username"])
+    items = pd.DataFrame({
+        "notam_key": df["notam_key"].to_numpy(),
+        "category": df["tag_type"].astype(object).fillna("").astype(str).to_numpy(),
+    })
+    # categorie rare per prime, poi ordine di chiave dentro la categoria
+    sizes = items["category"].map(items["category"].value_counts())
+    items = items.assign(size=sizes).sort_values(["size", "category", "notam_key"]).reset_index(drop=True)
+    slots = np.arange(len(items))[:, None] * redundancy + np.arange(redundancy)[None, :]
+    owners = np.asarray(pilots, dtype=object)[slots % len(pilots)]
+    return pd.DataFrame({
+        "notam_key": np.repeat(items["notam_key"].to_numpy(), redundancy),
+        "username": owners.ravel(),
+    })
+
+
+class WorkloadScheduler:
+    """Assegnazioni per una versione del dataset, su SQLite condiviso tra i processi."""
+
+    def __init__(self, db_path, dataset, pilots, redundancy=DEFAULT_REDUNDANCY,
+                 drop_after_days=DEFAULT_DROP_DAYS):
+        self.db_path = db_path
+        self.dataset = dataset
+        self.version = dataset.version
+        self.pilots = sorted(set(pilots))
+        self.redundancy = redundancy
+        self.drop_after = drop_after_days * 86400
+        # Streamlit può eseguire i rerun della stessa sessione su thread diversi
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False,
+                                    isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS assignment ("
+            "dataset_version TEXT NOT NULL, username TEXT NOT NULL, notam_key TEXT NOT NULL, "
+            "done INTEGER NOT NULL DEFAULT 0, assigned_at REAL, "
+            "PRIMARY KEY (dataset_version, username, notam_key)) WITHOUT ROWID"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS assignment_key ON assignment (dataset_version, notam_key)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pilot (username TEXT PRIMARY KEY, last_seen REAL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS plan (dataset_version TEXT PRIMARY KEY, created_at REAL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS queue_revision ("
+            "dataset_version TEXT NOT NULL, username TEXT NOT NULL, revision INTEGER NOT NULL, "
+            "PRIMARY KEY (dataset_version, username)) WITHOUT ROWID"
+        )
+
+    def _transaction(self):
+        # BEGIN IMMEDIATE: un solo processo alla volta crea o ribilancia il piano
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def ensure_plan(self):
+        """Crea il piano per questa versione del dataset, se non esiste ancora.
+
+        Le assegnazioni del piano precedente restano ai NOTAM ancora presenti (stessa
+        chiave), con il loro `done`; solo le chiavi nuove ricevono piloti a rotazione.
+        """
+        exists = self.conn.execute(
+            "SELECT 1 FROM plan WHERE dataset_version = ?", (self.version,)
+        ).fetchone()
+        if exists:
+            return False
+        conn = self._transaction()
+        try:
+            if conn.execute("SELECT 1 FROM plan WHERE dataset_version = ?",
+                            (self.version,)).fetchone() is None:
+                now = time.time()
+                previous = conn.execute(
+                    "SELECT dataset_version FROM plan ORDER BY created_at DESC LIMIT 1"
+                ).fetchone()
+                carried = pd.DataFrame(columns=["username", "notam_key", "done", "assigned_at"])
+                if previous is not None:
+                    carried = pd.read_sql_query(
+                        "SELECT username, notam_key, done, assigned_at FROM assignment WHERE dataset_version = ?",
+                        conn, params=previous,
+                    )
+                    carried = carried[carried["notam_key"].isin(self.dataset.key_index)]
+                new_keys = ~self.dataset.df["notam_key"].isin(carried["notam_key"])
+                plan = plan_assignments(self.dataset.df[new_keys], self.pilots, self.redundancy)
+                conn.executemany(
+                    "INSERT INTO assignment (dataset_version, username, notam_key, done, assigned_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(self.version, user, key, int(done), assigned_at)
+                     for user, key, done, assigned_at in carried.itertuples(index=False)]
+                    + [(self.version, user, key, 0, now) for key, user in plan.itertuples(index=False)],
+                )
+                conn.execute("INSERT INTO plan VALUES (?, ?)", (self.version, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def checkin(self, username):
+        """Il pilota è attivo (usato per riconoscere chi ha abbandonato)."""
+        self.conn.execute(
+            "INSERT INTO pilot VALUES (?, ?) ON CONFLICT (username) DO UPDATE SET last_seen = excluded.last_seen",
+            (username, time.time()),
+        )
+
+    def mark_done(self, username, keys):
+        """Segna come annotati i NOTAM assegnati al pilota (le altre chiavi sono ignorate)."""
+        keys = list(keys)
+        if not keys:
+            return
+        self.conn.execute("BEGIN")
+        self.conn.executemany(
+            "UPDATE assignment SET done = 1 WHERE dataset_version = ? AND username = ? AND notam_key = ?",
+            ((self.version, username, key) for key in keys),
+        )
+        self.conn.execute("COMMIT")
+
+    def queue(self, username):
+        """Chiavi assegnate al pilota per questa versione del dataset."""
+        cur = self.conn.execute(
+            "SELECT notam_key FROM assignment WHERE dataset_version = ? AND username = ?",
+            (self.version, username),
+        )
+        return [row[0] for row in cur]
+
+    def queue_revision(self, username):
+        """Revisione della coda del pilota: cambia quando il ribilanciamento la modifica."""
+        row = self.conn.execute(
+            "SELECT revision FROM queue_revision WHERE dataset_version = ? AND username = ?",
+            (self.version, username),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _active_pilots(self, now):
+        seen = dict(self.conn.execute("SELECT username, last_seen FROM pilot"))
+        # chi non è mai entrato conta dal momento in cui ha ricevuto il lavoro; un pilota
+        # senza assegnazioni (appena aggiunto) è attivo
+        assigned = dict(self.conn.execute(
+            "SELECT username, MIN(assigned_at) FROM assignment WHERE dataset_version = ? GROUP BY username",
+            (self.version,),
+        ))
+        return [p for p in self.pilots if now - seen.get(p, assigned.get(p, now)) < self.drop_after]
+
+    def rebalance(self):
+        """Sposta il lavoro aperto da piloti assenti o troppo carichi a chi ne ha meno.
+
+        Restituisce il numero di assegnazioni spostate.
+        """
+        now = time.time()
+        conn = self._transaction()
+        try:
+            active = self._active_pilots(now)
+            open_counts = dict(conn.execute(
+                "SELECT username, SUM(1 - done) FROM assignment WHERE dataset_version = ? GROUP BY username",
+                (self.version,),
+            ))
+            # controllo veloce: nessun pilota assente con lavoro aperto, nessun attivo senza lavoro
+            if not any(n and user not in active for user, n in open_counts.items()) and \
+                    all(open_counts.get(p, 0) > 0 for p in active):
+                conn.execute("COMMIT")
+                return 0
+            open_items = pd.read_sql_query(
+                "SELECT username, notam_key FROM assignment WHERE dataset_version = ? AND done = 0",
+                conn, params=(self.version,),
+            )
+            # chi ha già ogni NOTAM aperto (annotato o no), per non assegnarlo due volte
+            held = pd.read_sql_query(
+                "SELECT username, notam_key FROM assignment WHERE dataset_version = ? AND notam_key IN "
+                "(SELECT notam_key FROM assignment WHERE dataset_version = ? AND done = 0)",
+                conn, params=(self.version, self.version),
+            )
+            moves = self._plan_moves(open_items, held, active)
+            conn.executemany(
+                "UPDATE assignment SET username = ?, assigned_at = ? "
+                "WHERE dataset_version = ? AND username = ? AND notam_key = ?",
+                ((dst, now, self.version, src, key) for key, src, dst in moves),
+            )
+            # le sessioni aperte dei piloti coinvolti ricostruiscono la vista
+            conn.executemany(
+                "INSERT INTO queue_revision VALUES (?, ?, 1) "
+                "ON CONFLICT (dataset_version, username) DO UPDATE SET revision = revision + 1",
+                ((self.version, user) for user in {user for _, src, dst in moves for user in (src, dst)}),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(moves)
+
+    def _plan_moves(self, open_items, held, active):
+        if not active:
+            return []
+        holders = held.groupby("notam_key")["username"].agg(set).to_dict()
+        load = open_items["username"].value_counts().reindex(active, fill_value=0).to_dict()
+
+        def receiver(key):
+            candidates = [p for p in active if p not in holders[key]]
+            return min(candidates, key=lambda p: (load[p], p)) if candidates else None
+
+        moves = []
+
+        def move(key, src, dst):
+            moves.append((key, src, dst))
+            holders[key].discard(src)
+            holders[key].add(dst)
+            load[dst] += 1
+            if src in load:
+                load[src] -= 1
+
+        # 1) lavoro aperto di piloti assenti o non più registrati
+        orphaned = open_items[~open_items["username"].isin(active)]
+        for key, src in zip(orphaned["notam_key"], orphaned["username"]):
+            dst = receiver(key)
+            if dst is not None:
+                move(key, src, dst)
+
+        # 2) chi ha finito (o è nuovo) prende lavoro dai più carichi, fino alla media
+        target = int(np.ceil(sum(load.values()) / len(active)))
+        by_user = open_items[open_items["username"].isin(active)].groupby("username")["notam_key"].agg(list)
+        for dst in [p for p in active if load[p] == 0]:
+            for src in sorted(by_user.index, key=lambda p: -load[p]):
+                for key in list(by_user[src]):
+                    if load[dst] >= target or load[src] <= target:
+                        break
+                    if dst not in holders[key] and src in holders[key]:
+                        move(key, src, dst)
+                        by_user[src].remove(key)
+        return moves
+
+    def stats(self):
+        """Per pilota: assegnati, annotati, aperti e ultimo accesso (pannello admin)."""
+        table = pd.read_sql_query(
+            "SELECT a.username, COUNT(*) AS assigned, SUM(a.done) AS done, "
+            "MAX(p.last_seen) AS last_seen FROM assignment a "
+            "LEFT JOIN pilot p ON p.username = a.username "
+            "WHERE a.dataset_version = ? GROUP BY a.username",
+            self.conn, params=(self.version,),
+        )
+        table["open"] = table["assigned"] - table["done"]
+        table["last_seen"] = pd.to_datetime(table["last_seen"], unit="s")
+        return table.set_index("username")
+
+
+class DoneWriter:
+    """Adattatore per `write_behind`: i NOTAM salvati vengono segnati `done` in background.
+
+    Ha una propria connessione (vedi `search_index.NotesWriter`), usata solo dal thread
+    del writer.
+    """
+
+    def __init__(self, scheduler, username):
+        self.scheduler = WorkloadScheduler(scheduler.db_path, scheduler.dataset, scheduler.pilots,
+                                           scheduler.redundancy)
+        self.username = username
+
+    def save_many(self, feedback):
+        self.scheduler.mark_done(self.username, feedback.keys())
+
+    def get(self, key):
+        return None
@@ -0,0 +1,213 @@
+"""
+⏳ Salvataggio in differita (write-behind) dei feedback
+======================================================
+
+"Save Feedback" non scrive più sul thread dello script: il feedback entra in un buffer
+del processo e un thread in background lo scrive nello store dell'utente (journal o
+SQLite) ogni `WRITE_BEHIND_SECONDS` secondi (default 2), con un'unica `save_many` per
+utente. Più salvataggi della stessa riga nello stesso intervallo diventano una sola
+scrittura.
+
+- Il buffer è limitato (`MAX_PENDING` righe): se è pieno chi salva aspetta la scrittura
+  successiva invece di far crescere la memoria, al massimo `SUBMIT_TIMEOUT` secondi
+  (poi `submit` solleva `TimeoutError`).
+- Se la scrittura di uno store fallisce le righe restano nel buffer e si riprova dopo
+  un'attesa che raddoppia a ogni errore (fino a `MAX_BACKOFF` secondi).
+- "Exit for today" chiama `flush()` e attende che tutto sia scritto prima di compattare
+  nel CSV (scritto con file temporaneo + rename, mai a metà); `flush()` restituisce
+  False se la scrittura è fallita.
+- Le letture (`get`) vedono anche i feedback non ancora scritti.
+- `status()` riporta righe in attesa, ultima scrittura ed eventuale errore, per la UI.
+
+Con `WRITE_BEHIND_SECONDS = 0` si usa `SyncSaver`: stessa interfaccia, scrittura immediata.
+"""
+
+import atexit
+import threading
+import time
+
+FLUSH_SECONDS = 2
+MAX_PENDING = 10_000
+SUBMIT_TIMEOUT = 30
+MAX_BACKOFF = 60
+
+
+class WriteBehindSaver:
+    """Buffer dei feedback per store, scritto da un thread in background."""
+
+    def __init__(self, interval=FLUSH_SECONDS, max_pending=MAX_PENDING, submit_timeout=SUBMIT_TIMEOUT):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.submit_timeout = submit_timeout
+        self._cond = threading.Condition()
+        self._pending = {}   # id(store) -> (store, {chiave: campi fb_*}) da scrivere
+        self._writing = {}   # idem, in scrittura in questo momento
+        self._count = 0      # righe in _pending
+        self._status = {}    # id(store) -> {"last_flush": ts, "error": str | None}
+        self._failures = {}  # id(store) -> (errori consecutivi, prossimo tentativo in monotonic)
+        self._submitted = {}  # id(store) -> numero di submit / ultimo submit già scritto (o tentato)
+        self._written = {}
+        self._urgent = set()  # store di cui è stato chiesto il flush: scritti subito e per primi
+        self._flush_requested = False
+        self._requested = 0  # generazioni di flush richieste / completate
+        self._completed = 0
+        self._thread = threading.Thread(target=self._run, name="feedback-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, store, feedback):
+        """Accoda {chiave: campi fb_*} per lo store; ritorna subito se il buffer non è pieno.
+
+        Con il buffer pieno aspetta la scrittura, al massimo `submit_timeout` secondi.
+        """
+        with self._cond:
+            if self._count >= self.max_pending:
+                # buffer pieno: anticipa la scrittura e aspetta (backpressure)
+                self._flush_requested = True
+                self._cond.notify_all()
+                if not self._cond.wait_for(lambda: self._count < self.max_pending, self.submit_timeout):
+                    raise TimeoutError(f"Feedback buffer full ({self._count} rows waiting to be written)")
+            rows = self._pending.setdefault(id(store), (store, {}))[1]
+            before = len(rows)
+            rows.update(feedback)
+            self._count += len(rows) - before
+            self._submitted[id(store)] = self._submitted.get(id(store), 0) + 1
+
+    def get(self, store, key):
+        """Feedback della riga: quello in attesa di scrittura se c'è, altrimenti dallo store."""
+        with self._cond:
+            for buffer in (self._pending, self._writing):
+                entry = buffer.get(id(store))
+                if entry is not None and key in entry[1]:
+                    return entry[1][key]
+        return store.get(key)
+
+    def flush(self, timeout=None, store=None, username=None):
+        """Scrive subito ciò che è stato accodato finora (anche se in attesa di riprovare) e aspetta.
+
+        Con `store` (o `username`: tutti gli store di quell'utente, anche di sessioni
+        precedenti) aspetta solo quei salvataggi, senza dipendere dagli altri utenti.
+        False se scade il timeout o se la scrittura è fallita: l'errore è in `status()`.
+        """
+        with self._cond:
+            if store is None and username is None:
+                self._requested += 1
+                target = self._requested
+                self._flush_requested = True
+                self._cond.notify_all()
+                if not self._cond.wait_for(lambda: self._completed >= target, timeout):
+                    return False
+                return not self._failures
+
+            if store is not None:
+                store_ids = {id(store)}
+            else:
+                store_ids = {store_id for buffer in (self._pending, self._writing)
+                             for store_id, (owner, _) in buffer.items()
+                             if getattr(owner, "username", None) == username}
+            targets = {}
+            for store_id in store_ids:
+                if store_id in self._failures and store_id in self._pending:
+                    # righe rimaste da una scrittura fallita: si riprova adesso
+                    self._submitted[store_id] += 1
+                targets[store_id] = self._submitted.get(store_id, 0)
+            self._urgent |= store_ids
+            self._flush_requested = True
+            self._cond.notify_all()
+            if not self._cond.wait_for(
+                    lambda: all(self._written.get(store_id, 0) >= target for store_id, target in targets.items()),
+                    timeout):
+                return False
+            return not any(store_id in self._failures for store_id in targets)
+
+    def status(self, store):
+        """{"pending": righe non ancora scritte, "last_flush": ts, "error": str | None}."""
+        with self._cond:
+            pending = sum(len(buffer[id(store)][1]) for buffer in (self._pending, self._writing)
+                          if id(store) in buffer)
+            status = dict(self._status.get(id(store), {"last_flush": None, "error": None}))
+        status["pending"] = pending
+        return status
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._flush_requested, timeout=self.interval)
+                self._flush_requested = False
+                generation = self._requested
+                # un flush() esplicito riprova subito anche gli store in errore
+                forced = generation > self._completed
+                urgent, self._urgent = self._urgent, set()
+                now = time.monotonic()
+                eligible = [store_id for store_id in self._pending
+                            if forced or store_id in urgent or self._failures.get(store_id, (0, 0))[1] <= now]
+                # prima gli store di cui qualcuno aspetta il flush
+                eligible.sort(key=lambda store_id: store_id not in urgent)
+                batch = {store_id: self._pending.pop(store_id) for store_id in eligible}
+                self._count -= sum(len(rows) for _, rows in batch.values())
+                submitted = {store_id: self._submitted.get(store_id, 0) for store_id in batch}
+                self._writing = batch
+            self._write(batch, submitted)
+            with self._cond:
+                self._writing = {}
+                self._completed = generation
+                self._cond.notify_all()
+
+    def _write(self, batch, submitted):
+        for store_id, (store, rows) in batch.items():
+            try:
+                store.save_many(rows)
+                status = {"last_flush": time.time(), "error": None}
+                with self._cond:
+                    self._failures.pop(store_id, None)
+            except Exception as exc:
+                # si riprova più tardi, senza sovrascrivere salvataggi più recenti
+                with self._cond:
+                    retry = self._pending.setdefault(store_id, (store, {}))[1]
+                    for key, fields in rows.items():
+                        if key not in retry:
+                            retry[key] = fields
+                            self._count += 1
+                    errors = self._failures.get(store_id, (0, 0))[0] + 1
+                    backoff = min(self.interval * 2 ** errors, MAX_BACKOFF)
+                    self._failures[store_id] = (errors, time.monotonic() + backoff)
+                previous = self._status.get(store_id, {})
+                status = {"last_flush": previous.get("last_flush"), "error": str(exc)}
+            with self._cond:
+                self._status[store_id] = status
+                self._written[store_id] = submitted[store_id]
+                self._cond.notify_all()
+
+
+class SyncSaver:
+    """Stessa interfaccia, scrittura immediata sul thread dello script."""
+
+    def submit(self, store, feedback):
+        store.save_many(feedback)
+
+    def get(self, store, key):
+        return store.get(key)
+
+    def flush(self, timeout=None, store=None, username=None):
+        return True
+
+    def status(self, store):
+        return {"pending": 0, "last_flush": None, "error": None}
+
+
+SYNC_SAVER = SyncSaver()
+
+_lock = threading.Lock()
+_saver = None
+
+
+def get_saver(interval=FLUSH_SECONDS):
+    """Saver del processo, condiviso tra le sessioni (SyncSaver se `interval` è 0)."""
+    global _saver
+    if not interval:
+        return SYNC_SAVER
+    with _lock:
+        if _saver is None:
+            _saver = WriteBehindSaver(interval)
+            # all'uscita del processo scrive ciò che resta nel buffer
+            atexit.register(_saver.flush, 10)
+        return _saver